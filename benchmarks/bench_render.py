@@ -0,0 +1,97 @@
+"""
+Render large RSS and Atom feeds, with and without the incremental latest
+date tracking and the memoized date formatters.
+
+    PYTHONPATH=. python benchmarks/bench_render.py [--items 10000] [--repeat 5]
+"""
+
+import argparse
+import datetime
+import time
+from contextlib import contextmanager
+from io import BytesIO
+from unittest import mock
+
+from starlette_feedgen import generator, utils
+from starlette_feedgen.generator import Atom1Feed, Rss201rev2Feed
+
+# Items imported in bulk share a handful of timestamps
+TIMESTAMPS = 50
+
+
+def build_feed(feed_class, items):
+    base = datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+    feed = feed_class(
+        title="Benchmark",
+        link="https://example.com/",
+        description="Benchmark feed",
+        feed_url="https://example.com/feed",
+    )
+    for i in range(items):
+        date = base + datetime.timedelta(hours=i % TIMESTAMPS)
+        feed.add_item(
+            title=f"Item {i}",
+            link=f"https://example.com/items/{i}",
+            description=f"Description of item {i}",
+            unique_id=f"item-{i}",
+            pubdate=date,
+            updateddate=date if i % 3 == 0 else None,
+            categories=["news", f"tag{i % 10}"],
+        )
+    return feed
+
+
+def scan_latest_post_date(feed):
+    # What latest_post_date() did before dates were tracked as items are added
+    latest_date = None
+    for item in feed.items:
+        for item_date in (item.updateddate, item.pubdate):
+            if item_date and (latest_date is None or item_date > latest_date):
+                latest_date = item_date
+    return latest_date
+
+
+@contextmanager
+def uncached():
+    with mock.patch.object(
+        generator, "rfc2822_date", lambda date: utils._rfc2822_date.__wrapped__(date, None)
+    ), mock.patch.object(
+        generator, "rfc3339_date", lambda date: utils._rfc3339_date.__wrapped__(date, None)
+    ), mock.patch.object(
+        generator.SyndicationFeed, "latest_post_date", scan_latest_post_date
+    ):
+        yield
+
+
+def render(feed, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        utils._rfc2822_date.cache_clear()
+        utils._rfc3339_date.cache_clear()
+        start = time.perf_counter()
+        feed.latest_post_date()
+        feed.write(BytesIO(), "utf-8")
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--items", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    for feed_class in (Rss201rev2Feed, Atom1Feed):
+        feed = build_feed(feed_class, args.items)
+        with uncached():
+            before = render(feed, args.repeat)
+        after = render(feed, args.repeat)
+        print(
+            f"{feed_class.__name__:<16} {args.items} items: "
+            f"{before * 1000:8.1f} ms uncached, {after * 1000:8.1f} ms cached "
+            f"({before / after:.2f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,28 @@
 """RSS/Atom feeds generation for Starlette, adapted from Django syndication feed framework"""
 
+from .aggregate import AggregateFeedEndpoint
+from .cache import (
+    CacheBackend,
+    FeedCache,
+    FileSystemCacheBackend,
+    FragmentCache,
+    MemoryCacheBackend,
+    RedisCacheBackend,
+)
 from .feed import FeedEndpoint
+from .lifespan import combine_lifespans
+from .scheduler import FeedRefreshScheduler
 
-__all__ = ("FeedEndpoint",)
+__all__ = (
+    "AggregateFeedEndpoint",
+    "CacheBackend",
+    "FeedCache",
+    "FeedEndpoint",
+    "FeedRefreshScheduler",
+    "FileSystemCacheBackend",
+    "FragmentCache",
+    "MemoryCacheBackend",
+    "RedisCacheBackend",
+    "combine_lifespans",
+)
 __version__ = "0.1.3"
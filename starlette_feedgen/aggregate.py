@@ -0,0 +1,193 @@
+"""
+Feeds merging the items of several sources, e.g. a "river" of the latest
+items of every section of a site.
+"""
+import inspect
+import logging
+from abc import abstractmethod
+from asyncio import Semaphore, TimeoutError, gather, wait_for
+from heapq import heappop, heappush
+from typing import Any, AsyncIterable, AsyncIterator, Iterable, List, Optional, Tuple
+
+from .feed import FeedEndpoint
+from .utils import epoch_microseconds, run_async_or_thread
+
+logger = logging.getLogger(__name__)
+
+_END = object()
+
+
+class AggregateFeedEndpoint(FeedEndpoint):
+    """
+    Feed of the latest items of several sources. Each source yields its
+    items newest first; sources are fetched concurrently and merged on
+    item_pubdate, skipping items whose guid (item_guid, else an item_link
+    of their own) was already seen; items with neither are all kept.
+    Merging stops once max_items items are merged, so that only the head of
+    each source is ever fetched.
+
+    A source failing or timing out is logged and left out of the feed.
+    """
+
+    # Aggregated feeds are limited by default, see FeedEndpoint.max_items
+    max_items: Optional[int] = 100
+    # Number of sources fetched at the same time
+    max_source_concurrency: int = 10
+    # Seconds to wait for a source to return its first item, and then for
+    # each next item (None: no timeout)
+    source_timeout: Optional[float] = 10.0
+
+    @abstractmethod
+    def get_sources(self) -> Iterable[Any]:
+        """
+        Return the sources of the feed, passed to get_source_items.
+        """
+
+    @abstractmethod
+    def get_source_items(self, source: Any) -> Iterable:
+        """
+        Return the items of a source newest first, or an async iterable of
+        them. May accept a `limit` keyword argument: at most that many items
+        are needed.
+        """
+
+    async def get_items(self) -> AsyncIterator[Any]:
+        return self.merge_sources()
+
+    async def merge_sources(self) -> AsyncIterator[Any]:
+        sources = list(await run_async_or_thread(self.get_sources))
+        params = {}
+        if self.max_items is not None and _accepts_limit(self.get_source_items):
+            params["limit"] = self.max_items
+        semaphore = Semaphore(self.max_source_concurrency)
+        opened = await gather(*(self._open_source(source, semaphore, params) for source in sources))
+        iterators = {}
+        heap: List[Tuple[float, int, Any]] = []
+        for index, (iterator, item) in enumerate(opened):
+            if iterator is not None:
+                iterators[index] = iterator
+                heappush(heap, (await self._merge_key(item), index, item))
+        seen = set()
+        count = 0
+        try:
+            while heap and (self.max_items is None or count < self.max_items):
+                _, index, item = heappop(heap)
+                next_item = await self._next_item(sources[index], iterators[index])
+                if next_item is _END:
+                    await _close(iterators.pop(index))
+                else:
+                    heappush(heap, (await self._merge_key(next_item), index, next_item))
+                guid = await self._dedupe_key(item)
+                if guid is not None:
+                    if guid in seen:
+                        self._pop_resolved_hooks(item)
+                        continue
+                    seen.add(guid)
+                count += 1
+                yield item
+        finally:
+            for _, _, item in heap:
+                self._pop_resolved_hooks(item)
+            await gather(*(_close(iterator) for iterator in iterators.values()))
+
+    async def _open_source(
+        self, source: Any, semaphore: Semaphore, params: Any
+    ) -> Tuple[Optional[Any], Any]:
+        """Return an async iterator of the source items and its first item"""
+        async with semaphore:
+            try:
+                items = await wait_for(
+                    run_async_or_thread(self.get_source_items, source, **params),
+                    self.source_timeout,
+                )
+            except Exception as exc:
+                self.report_source_failure(source, exc)
+                return None, None
+            iterator = _aiter(items)
+            item = await self._next_item(source, iterator)
+        if item is _END:
+            await _close(iterator)
+            return None, None
+        return iterator, item
+
+    async def _next_item(self, source: Any, iterator: Any) -> Any:
+        try:
+            return await wait_for(iterator.__anext__(), self.source_timeout)
+        except StopAsyncIteration:
+            return _END
+        except Exception as exc:
+            self.report_source_failure(source, exc)
+            return _END
+
+    def report_source_failure(self, source: Any, exc: Exception) -> None:
+        """
+        Called when a source fails or times out, before the feed is merged
+        without it. Logs by default; override to record metrics.
+        """
+        if isinstance(exc, TimeoutError):
+            logger.warning("Feed source %r timed out", source)
+        else:
+            logger.error("Feed source %r failed", source, exc_info=exc)
+
+    async def _merge_key(self, item: Any) -> float:
+        # Newest first on a min-heap; items without a date go last
+        pubdate = await self._resolve_item_hook("item_pubdate", item)
+        if pubdate is None:
+            return float("inf")
+        return -epoch_microseconds(pubdate)
+
+    async def _dedupe_key(self, item: Any) -> Any:
+        guid = await self._resolve_item_hook("item_guid", item)
+        if guid is not None:
+            return guid
+        item_link = getattr(type(self), "item_link", None)
+        if item_link is FeedEndpoint.item_link:
+            # The default falls back to the feed link, shared by all items
+            return getattr(item, "link", None)
+        if callable(item_link):
+            return await self._resolve_item_hook("item_link", item)
+        return None
+
+
+class _SyncIterator:
+    __slots__ = ("_items",)
+
+    def __init__(self, items: Iterable) -> None:
+        self._items = iter(items)
+
+    def __aiter__(self) -> "_SyncIterator":
+        return self
+
+    async def __anext__(self) -> Any:
+        try:
+            return next(self._items)
+        except StopIteration:
+            raise StopAsyncIteration
+
+    async def aclose(self) -> None:
+        close = getattr(self._items, "close", None)
+        if close is not None:
+            close()
+
+
+def _aiter(items: Any) -> Any:
+    if isinstance(items, AsyncIterable):
+        return items.__aiter__()
+    return _SyncIterator(items)
+
+
+async def _close(iterator: Any) -> None:
+    aclose = getattr(iterator, "aclose", None)
+    if aclose is not None:
+        try:
+            await aclose()
+        except Exception:
+            logger.exception("Failed to close feed source")
+
+
+def _accepts_limit(function: Any) -> bool:
+    parameters = inspect.signature(function).parameters.values()
+    return any(
+        parameter.name == "limit" or parameter.kind is parameter.VAR_KEYWORD
+        for parameter in parameters
+    )
@@ -0,0 +1,598 @@
+"""
+Caching of rendered feeds.
+
+FeedCache keeps the final encoded bytes of a feed together with its media
+type and headers, so a cache hit skips get_items, item population and
+serialization altogether. Entries are stored in a CacheBackend: in process
+memory by default, or on a shared filesystem or Redis server so that several
+workers and hosts can share rendered feeds.
+
+FragmentCache keeps serialized items, so that a feed that changed is
+re-rendered without serializing its unchanged items again.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import mmap
+import os
+import re
+import tempfile
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+
+class CachedFeed:
+    """
+    A rendered feed: encoded body, media type and response headers. `expires`
+    is the UNIX time after which a cached copy is stale, if any. `encodings`
+    maps content codings (e.g. "gzip") to the compressed body. An immutable
+    feed, such as an archive page, is cached without expiry.
+    """
+
+    __slots__ = ("body", "media_type", "headers", "expires", "encodings", "immutable")
+
+    def __init__(
+        self,
+        body: bytes,
+        media_type: str,
+        headers: Optional[Dict[str, str]] = None,
+        expires: Optional[float] = None,
+        encodings: Optional[Dict[str, bytes]] = None,
+        immutable: bool = False,
+    ):
+        self.body = body
+        self.media_type = media_type
+        self.headers = headers or {}
+        self.expires = expires
+        self.encodings = encodings or {}
+        self.immutable = immutable
+
+    def __len__(self) -> int:
+        return len(self.body) + sum(len(body) for body in self.encodings.values())
+
+    @property
+    def is_stale(self) -> bool:
+        return self.expires is not None and self.expires <= time.time()
+
+    def dumps(self) -> bytes:
+        """
+        Serialize to a single JSON line with the media type, headers, expiry
+        time and compressed body sizes, followed by the body and then the
+        compressed bodies as is.
+        """
+        meta = json.dumps(
+            {
+                "media_type": self.media_type,
+                "headers": self.headers,
+                "expires": self.expires,
+                "encodings": [[coding, len(body)] for coding, body in self.encodings.items()],
+            }
+        )
+        return b"".join([meta.encode("utf-8"), b"\n", self.body, *self.encodings.values()])
+
+    @classmethod
+    def loads(cls, data: bytes) -> "CachedFeed":
+        meta, _, body = data.partition(b"\n")
+        parsed = json.loads(meta.decode("utf-8"))
+        encodings = {}
+        end = len(body)
+        for coding, size in reversed(parsed.get("encodings", ())):
+            start = end - size
+            encodings[coding] = body[start:end]
+            end = start
+        return cls(
+            body[:end],
+            parsed["media_type"],
+            parsed["headers"],
+            parsed.get("expires"),
+            dict(reversed(list(encodings.items()))),
+        )
+
+
+class CacheStats:
+    __slots__ = ("hits", "misses", "evictions", "coalesced", "stale")
+
+    def __init__(
+        self,
+        hits: int = 0,
+        misses: int = 0,
+        evictions: int = 0,
+        coalesced: int = 0,
+        stale: int = 0,
+    ) -> None:
+        self.hits = hits
+        self.misses = misses
+        self.evictions = evictions
+        self.coalesced = coalesced
+        self.stale = stale
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def __repr__(self) -> str:
+        return "CacheStats(hits=%d, misses=%d, evictions=%d, coalesced=%d, stale=%d)" % (
+            self.hits,
+            self.misses,
+            self.evictions,
+            self.coalesced,
+            self.stale,
+        )
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls for the same key: the first caller runs the
+    function, the others await the same result (or exception). Nothing is
+    remembered once the call is done, so a failure only affects the callers
+    that were waiting for it.
+    """
+
+    def __init__(self) -> None:
+        self.coalesced = 0
+        self._calls: Dict[str, "asyncio.Future[Any]"] = {}
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    async def do(self, key: str, func: Callable[[], Awaitable[Any]]) -> Any:
+        return await asyncio.shield(self.start(key, func))
+
+    def start(self, key: str, func: Callable[[], Awaitable[Any]]) -> "asyncio.Future[Any]":
+        """
+        Return the in-flight call for the key, starting it if there is none.
+        """
+        call = self._calls.get(key)
+        if call is None:
+            # Run as a separate task, so that a cancelled caller (e.g. a client
+            # that disconnected) does not cancel the call for everyone else.
+            call = asyncio.ensure_future(func())
+            self._calls[key] = call
+            call.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            self.coalesced += 1
+        return call
+
+    def _forget(self, key: str, call: "asyncio.Future[Any]") -> None:
+        if self._calls.get(key) is call:
+            del self._calls[key]
+        if not call.cancelled():
+            # Mark the exception as retrieved even if every caller went away
+            call.exception()
+
+
+class CacheBackend(ABC):
+    """
+    Storage for cached feeds. Values are bytes (see CachedFeed.dumps), or
+    CachedFeed objects as is for backends with `serialize` false; ttl is in
+    seconds, None meaning the value never expires.
+    """
+
+    evictions = 0
+    serialize = True
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[bytes]:
+        ...
+
+    @abstractmethod
+    async def set(self, key: str, value: bytes, ttl: Optional[float] = None) -> None:
+        ...
+
+    @abstractmethod
+    async def delete(self, key: str) -> None:
+        ...
+
+    async def clear(self) -> None:
+        raise NotImplementedError("%s does not support clear()" % type(self).__name__)
+
+
+class MemoryCacheBackend(CacheBackend):
+    """
+    In-process LRU storage. When more than `max_entries` entries or more than
+    `max_bytes` bytes are stored, the least recently used entries are evicted.
+    Feeds are kept as CachedFeed objects, so a hit copies nothing.
+    """
+
+    serialize = False
+
+    def __init__(self, max_entries: Optional[int] = 128, max_bytes: Optional[int] = None) -> None:
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.evictions = 0
+        self._entries: "OrderedDict[str, Tuple[Optional[float], Any]]" = OrderedDict()
+        self._size = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def size(self) -> int:
+        """Total size in bytes of the stored values"""
+        return self._size
+
+    async def get(self, key: str) -> Any:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        self._remove(key)
+        if self.max_bytes is not None and len(value) > self.max_bytes:
+            return
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        self._entries[key] = (expires_at, value)
+        self._size += len(value)
+        while (self.max_entries is not None and len(self._entries) > self.max_entries) or (
+            self.max_bytes is not None and self._size > self.max_bytes
+        ):
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self._size -= len(evicted)
+            self.evictions += 1
+
+    async def delete(self, key: str) -> None:
+        self._remove(key)
+
+    async def clear(self) -> None:
+        self._entries.clear()
+        self._size = 0
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= len(entry[1])
+
+
+class FileSystemCacheBackend(CacheBackend):
+    """
+    Storage in a directory shared by several processes. Every value is a
+    file named after the hash of its key, written to a temporary file and
+    atomically renamed into place, so readers never see partial writes.
+    The expiry time is kept as the file modification time, and the last use
+    as its access time, leaving the file contents untouched so they can be
+    memory-mapped on read.
+
+    Expired files are deleted when read, and after each write the least
+    recently used files are evicted beyond `max_entries` files or
+    `max_bytes` bytes (counted by this process only).
+    """
+
+    # Expiry used for values stored without a ttl
+    forever = 10 * 365 * 24 * 3600
+
+    def __init__(
+        self, directory: str, max_entries: Optional[int] = 1024, max_bytes: Optional[int] = None
+    ) -> None:
+        self.directory = directory
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.evictions = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, hashlib.sha256(key.encode("utf-8")).hexdigest())
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await run_in_threadpool(self._read, self.path(key))
+
+    async def set(self, key: str, value: bytes, ttl: Optional[float] = None) -> None:
+        await run_in_threadpool(self._write, self.path(key), value, ttl)
+
+    async def delete(self, key: str) -> None:
+        await run_in_threadpool(self._unlink, self.path(key))
+
+    async def clear(self) -> None:
+        for name in os.listdir(self.directory):
+            await run_in_threadpool(self._unlink, os.path.join(self.directory, name))
+
+    def _read(self, path: str) -> Optional[bytes]:
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except FileNotFoundError:
+            return None
+        try:
+            stat = os.fstat(fd)
+            now = time.time()
+            if stat.st_mtime <= now:
+                self._unlink(path)
+                return None
+            # Record the use for eviction, keeping the expiry time
+            os.utime(fd if os.utime in os.supports_fd else path, (now, stat.st_mtime))
+            if not stat.st_size:
+                return b""
+            with mmap.mmap(fd, 0, access=mmap.ACCESS_READ) as mapped:
+                return mapped[:]
+        finally:
+            os.close(fd)
+
+    def _write(self, path: str, value: bytes, ttl: Optional[float]) -> None:
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as tmp:
+                tmp.write(value)
+            expires_at = time.time() + (ttl if ttl is not None else self.forever)
+            os.utime(tmp_path, (time.time(), expires_at))
+            os.replace(tmp_path, path)
+        except BaseException:
+            self._unlink(tmp_path)
+            raise
+        if self.max_entries is not None or self.max_bytes is not None:
+            self._evict()
+
+    def _evict(self) -> None:
+        now = time.time()
+        entries = []
+        size = 0
+        with os.scandir(self.directory) as scanned:
+            for entry in scanned:
+                if entry.name.startswith(".tmp-"):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                if stat.st_mtime <= now:
+                    self._unlink(entry.path)
+                    continue
+                entries.append((stat.st_atime, stat.st_size, entry.path))
+                size += stat.st_size
+        entries.sort()
+        count = len(entries)
+        for _, file_size, path in entries:
+            if (self.max_entries is None or count <= self.max_entries) and (
+                self.max_bytes is None or size <= self.max_bytes
+            ):
+                break
+            self._unlink(path)
+            count -= 1
+            size -= file_size
+            self.evictions += 1
+
+    def _unlink(self, path: str) -> None:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+
+class RedisCacheBackend(CacheBackend):
+    """
+    Storage on a Redis server through an async client, such as
+    redis.asyncio.Redis. Only get/set/delete (and scan for clear()) are
+    used, so any object with compatible coroutines works.
+    """
+
+    # Number of keys asked per SCAN call by clear()
+    scan_count = 500
+
+    def __init__(self, client: Any, prefix: str = "feedgen:") -> None:
+        self.client = client
+        self.prefix = prefix
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self.client.get(self.prefix + key)
+
+    async def set(self, key: str, value: bytes, ttl: Optional[float] = None) -> None:
+        if ttl is None:
+            await self.client.set(self.prefix + key, value)
+        else:
+            await self.client.set(self.prefix + key, value, px=max(int(ttl * 1000), 1))
+
+    async def delete(self, key: str) -> None:
+        await self.client.delete(self.prefix + key)
+
+    async def clear(self) -> None:
+        """Delete every key under the prefix, SCANning rather than blocking on KEYS"""
+        match = re.sub(r"([*?\[\]\\])", r"\\\1", self.prefix) + "*"
+        cursor = 0
+        while True:
+            cursor, keys = await self.client.scan(cursor, match=match, count=self.scan_count)
+            if keys:
+                await self.client.delete(*keys)
+            if not int(cursor):
+                break
+
+
+class FeedCache:
+    """
+    Cache of rendered feeds. Entries expire `ttl` seconds after they were
+    stored. Without an explicit backend, feeds are kept in process memory,
+    bounded by `max_entries` and `max_bytes`.
+
+    With `stale_ttl`, an expired feed is still served for that many seconds
+    while a fresh copy is rendered in the background.
+    """
+
+    def __init__(
+        self,
+        ttl: Optional[float] = 60,
+        max_entries: Optional[int] = 128,
+        max_bytes: Optional[int] = None,
+        backend: Optional[CacheBackend] = None,
+        stale_ttl: float = 0,
+    ) -> None:
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.backend = backend or MemoryCacheBackend(max_entries, max_bytes)
+        self.single_flight = SingleFlight()
+        self._hits = 0
+        self._misses = 0
+        self._stale = 0
+
+    @property
+    def stats(self) -> CacheStats:
+        return CacheStats(
+            self._hits,
+            self._misses,
+            self.backend.evictions,
+            self.single_flight.coalesced,
+            self._stale,
+        )
+
+    async def get(self, key: str) -> Optional[CachedFeed]:
+        data = await self.backend.get(key)
+        if data is None:
+            self._misses += 1
+            return None
+        self._hits += 1
+        return CachedFeed.loads(data) if self.backend.serialize else data
+
+    async def set(self, key: str, feed: CachedFeed) -> None:
+        if self.ttl is None or feed.immutable:
+            stored, ttl = feed, None
+        else:
+            stored = CachedFeed(
+                feed.body, feed.media_type, feed.headers, time.time() + self.ttl, feed.encodings
+            )
+            ttl = self.ttl + self.stale_ttl
+        await self.backend.set(key, stored.dumps() if self.backend.serialize else stored, ttl)
+
+    async def get_or_render(
+        self, key: str, render: Callable[[], Awaitable[CachedFeed]]
+    ) -> CachedFeed:
+        """
+        Return the cached feed, rendering and storing it on a miss. Concurrent
+        misses for the same key share a single render.
+        """
+        feed = await self.get(key)
+        if feed is None:
+            feed = await self.single_flight.do(key, lambda: self._render(key, render))
+        elif feed.is_stale:
+            self._stale += 1
+            self.single_flight.start(key, lambda: self._render(key, render)).add_done_callback(
+                self._log_failure
+            )
+        return feed
+
+    async def get_or_render_variant(
+        self, key: str, variant: str, render: Callable[[], Awaitable[Dict[str, CachedFeed]]]
+    ) -> CachedFeed:
+        """
+        Like get_or_render, for a feed rendered in several variants at once
+        (e.g. formats): on a miss, all of the variants returned by render are
+        stored, each under its own key (see variant_key).
+        """
+        feed = await self.get(self.variant_key(key, variant))
+        if feed is None:
+            feeds = await self.single_flight.do(key, lambda: self._render_variants(key, render))
+            feed = feeds[variant]
+        elif feed.is_stale:
+            self._stale += 1
+            self.single_flight.start(
+                key, lambda: self._render_variants(key, render)
+            ).add_done_callback(self._log_failure)
+        return feed
+
+    async def refresh_variants(
+        self, key: str, render: Callable[[], Awaitable[Dict[str, CachedFeed]]]
+    ) -> Dict[str, CachedFeed]:
+        return await self.single_flight.do(key, lambda: self._render_variants(key, render))
+
+    async def _render_variants(
+        self, key: str, render: Callable[[], Awaitable[Dict[str, CachedFeed]]]
+    ) -> Dict[str, CachedFeed]:
+        feeds = await render()
+        for variant, feed in feeds.items():
+            await self.set(self.variant_key(key, variant), feed)
+        return feeds
+
+    @staticmethod
+    def variant_key(key: str, variant: str) -> str:
+        return "%s#%s" % (key, variant)
+
+    async def refresh(self, key: str, render: Callable[[], Awaitable[CachedFeed]]) -> CachedFeed:
+        """
+        Render the feed and store it regardless of what is cached.
+        """
+        return await self.single_flight.do(key, lambda: self._render(key, render))
+
+    async def _render(self, key: str, render: Callable[[], Awaitable[CachedFeed]]) -> CachedFeed:
+        feed = await render()
+        await self.set(key, feed)
+        return feed
+
+    @staticmethod
+    def _log_failure(call: "asyncio.Future[Any]") -> None:
+        if not call.cancelled() and call.exception() is not None:
+            logger.error("Background feed refresh failed", exc_info=call.exception())
+
+    async def invalidate(self, *keys: str) -> None:
+        """Remove the given keys from the cache"""
+        for key in keys:
+            await self.backend.delete(key)
+
+    async def clear(self) -> None:
+        await self.backend.clear()
+
+
+class FragmentCache:
+    """
+    LRU cache of serialized feed items, see SyndicationFeed.fragment_cache.
+    Fragments are evicted once they take more than `max_bytes` (counted in
+    characters). Feeds may be serialized in several threads at once, so
+    access is locked.
+    """
+
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024) -> None:
+        self.max_bytes = max_bytes
+        self._fragments: "OrderedDict[Hashable, str]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._fragments)
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    @property
+    def stats(self) -> CacheStats:
+        return CacheStats(self._hits, self._misses, self._evictions)
+
+    def get(self, key: Hashable) -> Optional[str]:
+        with self._lock:
+            fragment = self._fragments.get(key)
+            if fragment is None:
+                self._misses += 1
+                return None
+            self._hits += 1
+            self._fragments.move_to_end(key)
+            return fragment
+
+    def set(self, key: Hashable, fragment: str) -> None:
+        if len(fragment) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._fragments.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous)
+            self._fragments[key] = fragment
+            self._size += len(fragment)
+            while self._size > self.max_bytes:
+                _, evicted = self._fragments.popitem(last=False)
+                self._size -= len(evicted)
+                self._evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._fragments.clear()
+            self._size = 0
@@ -0,0 +1,148 @@
+"""
+Command line interface, run as python -m starlette_feedgen.
+
+    python -m starlette_feedgen render myapp.feeds:ArchiveFeed /archive/2019 /archive/2020 \
+        --route "/archive/{year:int}" --root /var/www/feeds --jobs 4
+
+renders the feeds served at the given URLs to files that FeedEndpoint
+serves instead of rendering them per request, see FeedEndpoint.static_root.
+"""
+import argparse
+import asyncio
+import importlib
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence, Type
+from urllib.parse import urlsplit
+
+from starlette.routing import compile_path
+
+from .compression import available_codings
+from .feed import FeedEndpoint
+
+
+def import_endpoint(spec: str) -> Type[FeedEndpoint]:
+    """Import a FeedEndpoint subclass given as "module:Class" or "module.Class" """
+    if ":" in spec:
+        module_name, _, name = spec.partition(":")
+    else:
+        module_name, _, name = spec.rpartition(".")
+    if not module_name or not name:
+        raise ValueError("Expected module:Class, got %r" % spec)
+    endpoint = importlib.import_module(module_name)
+    for attr in name.split("."):
+        endpoint = getattr(endpoint, attr)
+    if not (isinstance(endpoint, type) and issubclass(endpoint, FeedEndpoint)):
+        raise ValueError("%s is not a FeedEndpoint subclass" % spec)
+    return endpoint
+
+
+def match_route(route: Optional[str], path: str) -> Dict[str, Any]:
+    """
+    Return the path parameters of the path according to a route pattern
+    such as "/archive/{year:int}".
+    """
+    if route is None:
+        return {}
+    regex, _, convertors = compile_path(route)
+    match = regex.match(path)
+    if match is None:
+        raise ValueError("%s does not match route %s" % (path, route))
+    return {name: convertors[name].convert(value) for name, value in match.groupdict().items()}
+
+
+def render(
+    spec: str,
+    url: str,
+    root: Optional[str] = None,
+    route: Optional[str] = None,
+    codings: Optional[Sequence[str]] = None,
+    secure: bool = True,
+) -> str:
+    """
+    Render the feed of the endpoint served at the URL (a path and optional
+    query string) to a file, and return the file path. Runs its own event
+    loop, so that it can be called in a worker process.
+    """
+    endpoint = import_endpoint(spec)
+    if root is not None:
+        endpoint.static_root = root
+    parts = urlsplit(url)
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(
+            endpoint.render_static(
+                parts.path, parts.query, secure, match_route(route, parts.path), codings
+            )
+        )
+    finally:
+        loop.close()
+
+
+def render_command(args: argparse.Namespace) -> int:
+    codings = None
+    if args.compress is not None:
+        codings = available_codings(
+            coding.strip() for coding in args.compress.split(",") if coding.strip()
+        )
+    jobs = args.jobs or os.cpu_count() or 1
+    render_args = [
+        (args.endpoint, url, args.root, args.route, codings, not args.insecure) for url in args.urls
+    ]
+    failed = 0
+    if jobs == 1 or len(render_args) == 1:
+        results: List[Any] = []
+        for item in render_args:
+            try:
+                results.append(render(*item))
+            except Exception as exc:
+                results.append(exc)
+    else:
+        with ProcessPoolExecutor(min(jobs, len(render_args))) as executor:
+            futures = [executor.submit(render, *item) for item in render_args]
+            results = [future.exception() or future.result() for future in futures]
+    for url, result in zip(args.urls, results):
+        if isinstance(result, BaseException):
+            failed += 1
+            print("%s: failed: %r" % (url, result), file=sys.stderr)
+        else:
+            print("%s -> %s" % (url, result))
+    return 1 if failed else 0
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m starlette_feedgen")
+    commands = parser.add_subparsers(dest="command")
+    commands.required = True
+
+    render_parser = commands.add_parser(
+        "render", help="render feeds to files served by FeedEndpoint.static_root"
+    )
+    render_parser.add_argument("endpoint", help="FeedEndpoint subclass, as module:Class")
+    render_parser.add_argument("urls", nargs="+", metavar="url", help="path and query of a feed")
+    render_parser.add_argument(
+        "--root", help="directory to render to (default: the endpoint's static_root)"
+    )
+    render_parser.add_argument(
+        "--route",
+        help='route pattern the URLs are matched against for path parameters, e.g. "/{year:int}"',
+    )
+    render_parser.add_argument(
+        "--compress",
+        metavar="CODINGS",
+        help='comma-separated content codings to write compressed copies with, e.g. "gzip,br" '
+        "(default: the endpoint's compression)",
+    )
+    render_parser.add_argument(
+        "--jobs", type=int, default=0, help="number of processes (default: one per CPU)"
+    )
+    render_parser.add_argument("--insecure", action="store_true", help="render http:// links")
+    render_parser.set_defaults(handler=render_command)
+
+    args = parser.parse_args(argv)
+    if args.command == "render" and args.root is None:
+        endpoint = import_endpoint(args.endpoint)
+        if endpoint.static_root is None:
+            parser.error("--root is required when the endpoint has no static_root")
+    return args.handler(args)
@@ -0,0 +1,121 @@
+"""
+Content codings used to serve pre-compressed feeds.
+
+gzip is always available; br and zstd are used when the brotli and
+zstandard packages are installed.
+"""
+import zlib
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Compression levels for streamed responses, favouring speed, and for
+# rendered feeds, which are compressed once and then served many times.
+STREAM_LEVELS = {"gzip": 6, "br": 5, "zstd": 3}
+LEVELS = {"gzip": 9, "br": 9, "zstd": 12}
+
+
+class Compressor:
+    """
+    Incremental compressor for a content coding. flush() returns everything
+    compressed so far without ending the stream, so that the client can
+    decompress what it received; finish() ends the stream.
+    """
+
+    def __init__(self, coding: str, level: Optional[int] = None) -> None:
+        self.coding = coding
+        if level is None:
+            level = STREAM_LEVELS.get(coding)
+        if coding == "gzip":
+            # wbits=31 writes a gzip header with a zero timestamp, so the output
+            # only depends on the input
+            self._compressor: Any = zlib.compressobj(level, zlib.DEFLATED, 31)
+        elif coding == "br" and brotli is not None:
+            self._compressor = brotli.Compressor(quality=level)
+        elif coding == "zstd" and zstandard is not None:
+            self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+        else:
+            raise ValueError("Unsupported content coding: %s" % coding)
+
+    def compress(self, data: bytes) -> bytes:
+        if self.coding == "br":
+            return self._compressor.process(data)
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        if self.coding == "gzip":
+            return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+        if self.coding == "br":
+            return self._compressor.flush()
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        if self.coding == "br":
+            return self._compressor.finish()
+        return self._compressor.flush()
+
+
+def compress(data: bytes, coding: str) -> bytes:
+    """Compress a whole body at once"""
+    level = LEVELS.get(coding)
+    if coding == "br" and brotli is not None:
+        return brotli.compress(data, quality=level)
+    if coding == "zstd" and zstandard is not None:
+        return zstandard.ZstdCompressor(level=level).compress(data)
+    compressor = Compressor(coding, level)
+    return compressor.compress(data) + compressor.finish()
+
+
+def available_codings(codings: Iterable[str]) -> Tuple[str, ...]:
+    """Return the given content codings that can be produced here, in order"""
+    supported = {"gzip"}
+    if brotli is not None:
+        supported.add("br")
+    if zstandard is not None:
+        supported.add("zstd")
+    return tuple(coding for coding in codings if coding in supported)
+
+
+def negotiate_encoding(accept_encoding: str, codings: Iterable[str]) -> Optional[str]:
+    """
+    Pick the content coding to respond with from the given ones (in order of
+    preference), according to an Accept-Encoding header. Return None if the
+    response should not be encoded.
+    """
+    if not accept_encoding:
+        return None
+    weights = _parse_accept_encoding(accept_encoding)
+    wildcard = weights.get("*", 0.0)
+    best, best_weight = None, 0.0
+    for coding in codings:
+        weight = weights.get(coding, wildcard)
+        if weight > best_weight:
+            best, best_weight = coding, weight
+    return best
+
+
+def _parse_accept_encoding(accept_encoding: str) -> Dict[str, float]:
+    weights = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        weight = 1.0
+        for param in params.split(";"):
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[coding] = weight
+    return weights
@@ -0,0 +1,52 @@
+"""
+Delta encoding of feeds, following RFC 3229 with the "feed" instance
+manipulation: a client sends the ETag of the feed it has along with
+"A-IM: feed", and gets only the items added since.
+"""
+import datetime
+import threading
+from collections import OrderedDict
+from typing import Hashable, Iterable, Optional, Tuple
+
+from .utils import _strip_weak, epoch_microseconds, quote_etag
+
+
+def accepts_feed_delta(a_im: str) -> bool:
+    """Whether an A-IM request header accepts the "feed" instance manipulation"""
+    return any(token.partition(";")[0].strip().lower() == "feed" for token in a_im.split(","))
+
+
+def date_etag(date: datetime.datetime) -> str:
+    """ETag of a feed whose latest change is at the given date"""
+    return quote_etag("%x" % epoch_microseconds(date))
+
+
+class DeltaIndex:
+    """
+    Map the ETags of recently served feeds to the time of their latest
+    change, keeping the `max_entries` most recent ones.
+    """
+
+    def __init__(self, max_entries: int = 1024) -> None:
+        self.max_entries = max_entries
+        self._dates: "OrderedDict[Tuple[Hashable, str], datetime.datetime]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._dates)
+
+    def record(self, feed: Hashable, etag: str, date: datetime.datetime) -> None:
+        key = (feed, _strip_weak(etag))
+        with self._lock:
+            self._dates[key] = date
+            self._dates.move_to_end(key)
+            while len(self._dates) > self.max_entries:
+                self._dates.popitem(last=False)
+
+    def lookup(self, feed: Hashable, etags: Iterable[str]) -> Optional[datetime.datetime]:
+        """Return the date of the first of the ETags known for the feed"""
+        for etag in etags:
+            date = self._dates.get((feed, _strip_weak(etag)))
+            if date is not None:
+                return date
+        return None
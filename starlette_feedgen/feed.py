@@ -1,48 +1,823 @@
+import inspect
+import time
 from abc import ABC, abstractmethod
+from asyncio import Future, Semaphore, ensure_future, gather, iscoroutinefunction, wait
 from calendar import timegm
+from concurrent.futures import Executor
+from datetime import datetime, timezone
+from functools import partial
+from heapq import heappush, heapreplace
 from html import escape
 from http import HTTPStatus
 from io import BytesIO
-from typing import Any, AsyncIterable, Dict, Iterable, Optional, Type
+from types import FunctionType
+from typing import (
+    Any,
+    AsyncGenerator,
+    AsyncIterable,
+    AsyncIterator,
+    Callable,
+    Dict,
+    FrozenSet,
+    Iterable,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+)
+from urllib.parse import parse_qsl, urlencode
 
+from starlette.concurrency import run_in_threadpool
 from starlette.endpoints import HTTPEndpoint
 from starlette.exceptions import HTTPException
 from starlette.requests import Request
-from starlette.responses import StreamingResponse
+from starlette.responses import FileResponse, Response, StreamingResponse
 
-from .generator import DefaultFeed, Enclosure, SyndicationFeed
-from .utils import add_domain, http_date, run_async_or_thread
+from .cache import CachedFeed, FeedCache, FragmentCache
+from .compression import Compressor, available_codings, compress, negotiate_encoding
+from .delta import DeltaIndex, accepts_feed_delta, date_etag
+from .generator import DefaultFeed, Enclosure, FeedStreamWriter, SyndicationFeed
+from .metrics import NO_TIMER, FeedTimings, MetricsSink
+from .paging import Cursor, decode_cursor, encode_cursor, follows, item_cursor
+from .static import stat_fresh, static_file_path, write_atomic
+from .utils import (
+    add_domain,
+    build_request,
+    http_date,
+    is_not_modified,
+    negotiate_media_type,
+    parse_etags,
+    parse_http_date,
+    quote_etag,
+    run_async_or_thread,
+    url_normalizer,
+)
+from .websub import WebSubPublisher
+
+try:
+    from asyncio import get_running_loop
+except ImportError:  # Python 3.6
+    from asyncio import get_event_loop as get_running_loop
+
+# Dynamic attributes resolved for every item, see FeedEndpoint._get_item_kwargs
+ITEM_HOOKS = (
+    "item_title",
+    "item_description",
+    "item_link",
+    "item_enclosures",
+    "item_enclosure_url",
+    "item_enclosure_length",
+    "item_enclosure_mime_type",
+    "item_author_name",
+    "item_author_email",
+    "item_author_link",
+    "item_pubdate",
+    "item_updateddate",
+    "item_guid",
+    "item_guid_is_permalink",
+    "item_categories",
+    "item_copyright",
+    "item_version",
+)
+
+# item_* hooks that order_by values come straight from, see
+# FeedEndpoint._iter_batch_kwargs
+ORDER_HOOKS = {
+    "pubdate": "item_pubdate",
+    "updateddate": "item_updateddate",
+    "title": "item_title",
+    "version": "item_version",
+}
 
 
 class FeedEndpoint(HTTPEndpoint, ABC):
     feed_type: Type[SyndicationFeed] = DefaultFeed
+    # Formats to serve the feed in, e.g. (Rss201rev2Feed, Atom1Feed,
+    # JsonFeed), instead of feed_type. The format is picked by the
+    # format_param path parameter, matched against format_name (e.g. a
+    # "/feed.{format}" route), else by the Accept header, defaulting to the
+    # first one. When the feed is cached, its items are fetched once and
+    # rendered and cached in every format.
+    feed_types: Sequence[Type[SyndicationFeed]] = ()
+    format_param: str = "format"
     language: Optional[str] = None
     domain: Optional[str] = None
     link: str = "/"
+    # Serialize items as get_items produces them instead of building the whole
+    # feed first. lastBuildDate/updated then come from feed_updated (if defined).
+    stream: bool = False
+    # Rendered feeds are kept here, see get_cache_key. A cached feed is always
+    # rendered in full, even when streaming is enabled.
+    cache: Optional[FeedCache] = None
+    # Query parameters the feed depends on, besides cursor_param: others are
+    # left out of the cache key and of the links to other pages, so that
+    # arbitrary query strings do not fill the cache (None: the whole query).
+    cache_query_params: Optional[Sequence[str]] = ()
+    # Content codings, in order of preference, to serve the feed with when
+    # the client accepts them: "gzip", and "br" or "zstd" if brotli or
+    # zstandard are installed. Rendered feeds are compressed once and cached
+    # with every coding; streamed feeds are compressed as they are sent.
+    compression: Sequence[str] = ()
+    # Serialized items are kept here and reused by later renders of the feed
+    # until their guid and version (item_version, else the item updated or
+    # published date) change, see SyndicationFeed.fragment_key.
+    fragment_cache: Optional[FragmentCache] = None
+    # Feeds with at least this many items are serialized and compressed in
+    # the threadpool rather than on the event loop (None: always inline).
+    serialize_threshold: Optional[int] = 1000
+    # Feeds with at least serialize_executor_threshold items are serialized
+    # in this executor instead, typically a ProcessPoolExecutor so that the
+    # worker's event loop is not slowed down at all. The feed is pickled, so
+    # its generator class and item values (including extra kwargs) must be
+    # picklable.
+    serialize_executor: Optional[Executor] = None
+    serialize_executor_threshold: int = 10000
+    # Directory of feeds pre-rendered with render_static (or the render
+    # command). A pre-rendered file is served as is, without calling
+    # get_object, unless it is older than static_max_age seconds; the feed
+    # is rendered live when there is no fresh file.
+    static_root: Optional[str] = None
+    static_max_age: Optional[float] = None
+    # Serve at most page_size items per document, newest first, with a link
+    # to the next page of older items; the page is selected by a keyset
+    # cursor in the cursor_param query parameter. With archive_pages, older
+    # pages are RFC 5005 archive documents, cached forever. See get_items.
+    page_size: Optional[int] = None
+    archive_pages: bool = False
+    cursor_param: str = "cursor"
+    # Answer requests with "A-IM: feed" and the ETag of a feed served
+    # recently with 226 IM Used and only the items changed since (RFC 3229).
+    # The time of the feed of each ETag is kept in a per-process index of
+    # the delta_index_size latest ones. Feeds without get_etag are given an
+    # ETag derived from their latest change. Delta feeds are not streamed.
+    # See get_items.
+    delta_feeds: bool = False
+    delta_index_size: int = 1024
+    # WebSub hubs advertised in the feed, along with its self link (feed_url,
+    # which should then be absolute, e.g. by setting domain). See
+    # notify_updated, which notifies them through websub_publisher.
+    websub_hubs: Sequence[str] = ()
+    websub_publisher: Optional[WebSubPublisher] = None
+    # Serve at most max_items items: iteration of get_items stops (and the
+    # generator is closed) once they are read. With order_by, the add_item
+    # argument the feed is ordered on, newest first (e.g. "pubdate"), items
+    # are sorted, keeping only the max_items newest in memory. See get_items.
+    max_items: Optional[int] = None
+    order_by: Optional[str] = None
+    # What to do with text that has control characters, which XML 1.0 does
+    # not allow: "strict" fails the render with UnserializableContentError,
+    # "strip" removes them and "replace" replaces them with U+FFFD. The
+    # number of fixed fields is passed to report_sanitization.
+    sanitize: str = "strict"
+    # Time the stages of every request (get_object, validators, cache, items,
+    # serialize, stream) and pass them to this sink once the response is
+    # complete, along with the number of items and bytes, see metrics.py.
+    # With server_timing, responses have a Server-Timing header with the
+    # stages before the response started. Neither costs anything when unset.
+    metrics: Optional[MetricsSink] = None
+    server_timing: bool = False
+    # Items are processed in batches of this size: items_extra_kwargs runs
+    # once per batch and streamed feeds are sent one batch at a time. A
+    # streamed batch is sent early once its first item has waited
+    # stream_flush_interval seconds for more items from an async get_items.
+    item_batch_size: int = 100
+    stream_flush_interval: float = 0.05
+    # item_* hooks may be coroutine functions; the items of a batch are then
+    # resolved concurrently, with at most this many items at a time.
+    max_item_concurrency: int = 10
+    # How each dynamic attribute of the class is resolved, see _compile_dynamic_attr
+    _attr_resolvers: Dict[str, Callable[["FeedEndpoint", Any, Any], Any]] = {}
+    _async_item_hooks: Optional[Tuple[str, ...]] = None
+    _items_params: Optional[FrozenSet[str]] = None
+    _delta_index: Optional[DeltaIndex] = None
+    _timings: Optional[FeedTimings] = None
+    # Whether the last get_items call returned an async iterable
+    _async_items: bool = False
+    # Values of async item hooks awaited before the items are rendered, e.g.
+    # to order or merge them, by item id, see _resolve_item_hook
+    _resolved_hooks: Optional[Dict[int, Tuple[Any, Dict[str, Any]]]] = None
+
+    def __init_subclass__(cls, **kwargs: Any) -> None:
+        super().__init_subclass__(**kwargs)  # type: ignore
+        cls._attr_resolvers = {}
+        cls._async_item_hooks = None
+        cls._items_params = None
+        cls._delta_index = None
 
     @abstractmethod
     def get_items(self) -> Iterable:
-        ...
+        """
+        Return the items of the feed, or an async iterable of them.
+
+        Paged feeds (see page_size) may accept `limit` and `cursor` keyword
+        arguments: return at most `limit` items, newest first, published
+        before `cursor.pubdate` (or at the same time with a guid sorting
+        before `cursor.guid`) when a cursor is given. Delta feeds (see
+        delta_feeds) may accept `since`: return only the items published or
+        updated after that datetime when it is given. Items are otherwise
+        filtered by the endpoint.
+
+        Feeds with max_items may accept `limit` as well, and `order_by` to
+        return the items already ordered, newest first, on that add_item
+        argument; they are sorted by the endpoint otherwise, and `limit` is
+        then None as all the items are needed.
+        """
+
+    async def get(self, request: Request) -> Response:
+        if self.metrics is None and not self.server_timing:
+            return await self._get(request)
+        timings = self._timings = FeedTimings(type(self).__qualname__, request.url.path)
+        try:
+            response = await self._get(request)
+        except Exception as exc:
+            timings.status = exc.status_code if isinstance(exc, HTTPException) else 500
+            self._record_timings(timings)
+            raise
+        timings.status = response.status_code
+        if self.server_timing:
+            response.headers["Server-Timing"] = timings.server_timing()
+        if isinstance(response, StreamingResponse):
+            response.body_iterator = self._time_stream(response.body_iterator, timings)
+            return response
+        if isinstance(response, FileResponse):
+            timings.bytes = int(response.headers.get("content-length", 0))
+        else:
+            timings.bytes = len(response.body)
+        self._record_timings(timings)
+        return response
 
-    async def get(self, request: Request) -> StreamingResponse:
+    async def _time_stream(
+        self, chunks: AsyncIterable[bytes], timings: FeedTimings
+    ) -> AsyncIterator[bytes]:
+        started = time.perf_counter()
+        size = 0
         try:
-            obj = await self.get_object(request)
+            async for chunk in chunks:
+                size += len(chunk)
+                yield chunk
+        finally:
+            timings.add_stage("stream", started, time.perf_counter() - started)
+            timings.bytes = size
+            self._record_timings(timings)
+
+    def _record_timings(self, timings: FeedTimings) -> None:
+        timings.finish()
+        if self.metrics is not None:
+            self.metrics.record(timings)
+
+    def _stage(self, name: str) -> Any:
+        timings = self._timings
+        return NO_TIMER if timings is None else timings.stage(name)
+
+    async def _get(self, request: Request) -> Response:
+        # Reject invalid cursors before anything is looked up
+        self.get_cursor(request)
+        if self.static_root is not None:
+            response = await self.serve_static(request)
+            if response is not None:
+                return response
+        try:
+            with self._stage("get_object"):
+                obj = await self.get_object(request)
         except FeedDoesNotExist:
             raise HTTPException(int(HTTPStatus.NOT_FOUND), detail="Feed object does not exist")
+        with self._stage("validators"):
+            etag, last_modified, headers = await self._get_validators(obj)
+        coding = self.get_encoding(request)
+        if is_not_modified(request.headers, etag, last_modified):
+            return Response(
+                status_code=int(HTTPStatus.NOT_MODIFIED),
+                headers=self._response_headers(headers, coding),
+            )
+        if self.delta_feeds:
+            since = self._get_delta_since(obj, request)
+            if since is not None:
+                return await self.delta_response(obj, request, headers, coding, since)
+        if self.cache is not None and self.feed_types:
+            with self._stage("cache"):
+                rendered = await self.cache.get_or_render_variant(
+                    self.get_cache_key(obj, request),
+                    self.get_feed_type(request).__name__,
+                    partial(self.render_formats, obj, request, headers),
+                )
+        elif self.cache is not None:
+            with self._stage("cache"):
+                rendered = await self.cache.get_or_render(
+                    self.get_cache_key(obj, request), partial(self.render, obj, request, headers)
+                )
+        elif self.stream and self.page_size is None and not self.delta_feeds:
+            return self.stream_feed(obj, request, headers, coding)
+        else:
+            rendered = await self.render(obj, request, headers, (coding,) if coding else ())
+        if (etag is None or last_modified is None) and is_not_modified(
+            request.headers, rendered.headers.get("ETag"), _parse_last_modified(rendered.headers)
+        ):
+            # The validators were only known once the feed was rendered
+            return Response(
+                status_code=int(HTTPStatus.NOT_MODIFIED),
+                headers=self._response_headers(rendered.headers, coding),
+            )
+        if coding not in rendered.encodings:
+            # Cached before the coding was enabled
+            coding = None
+        return Response(
+            rendered.encodings[coding] if coding else rendered.body,
+            media_type=rendered.media_type,
+            headers=self._response_headers(rendered.headers, coding),
+        )
+
+    @classmethod
+    async def refresh(
+        cls,
+        path: str,
+        query: str = "",
+        secure: bool = True,
+        path_params: Optional[Dict[str, Any]] = None,
+    ) -> CachedFeed:
+        """
+        Render the feed served at the given path and store it in the cache,
+        replacing any cached copy. Used to keep feeds warm outside of the
+        request path, see FeedRefreshScheduler.
+        """
+        request = build_request(path, query, secure, cls.domain, path_params)
+        endpoint = cls(request.scope, request.receive, _send_nothing)
+        obj = await endpoint.get_object(request)
+        _, _, headers = await endpoint._get_validators(obj)
+        render = partial(endpoint.render, obj, request, headers)
+        if cls.cache is None:
+            return await render()
+        key = endpoint.get_cache_key(obj, request)
+        if cls.feed_types:
+            rendered = await cls.cache.refresh_variants(
+                key, partial(endpoint.render_formats, obj, request, headers)
+            )
+            return rendered[endpoint.get_feed_type(request).__name__]
+        return await cls.cache.refresh(key, render)
+
+    @classmethod
+    async def render_static(
+        cls,
+        path: str,
+        query: str = "",
+        secure: bool = True,
+        path_params: Optional[Dict[str, Any]] = None,
+        codings: Optional[Sequence[str]] = None,
+    ) -> str:
+        """
+        Render the feed served at the given path to its file under
+        static_root, and to a compressed copy next to it for each of the
+        content codings (all of `compression` by default). Files are
+        replaced atomically. Return the path of the file.
+        """
+        assert cls.static_root is not None, "static_root is not set"
+        request = build_request(path, query, secure, cls.domain, path_params)
+        endpoint = cls(request.scope, request.receive, _send_nothing)
+        obj = await endpoint.get_object(request)
+        _, _, headers = await endpoint._get_validators(obj)
+        rendered = await endpoint.render(obj, request, headers, codings)
+        file_path = static_file_path(cls.static_root, path, query)
+        # The uncompressed file goes first: compressed copies older than it
+        # are not served
+        await run_in_threadpool(write_atomic, file_path, rendered.body)
+        for coding, body in rendered.encodings.items():
+            await run_in_threadpool(
+                write_atomic, static_file_path(cls.static_root, path, query, coding), body
+            )
+        return file_path
+
+    async def serve_static(self, request: Request) -> Optional[Response]:
+        """
+        Return a response with the pre-rendered file of the requested feed,
+        or None if there is no fresh one.
+        """
+        assert self.static_root is not None, "static_root is not set"
+        feed_type = self.get_feed_type(request)
+        if self._negotiates_format() and feed_type is not self.feed_types[0]:
+            # Only the default format is pre-rendered for a URL
+            return None
+        path, query = request.url.path, request.url.query
+        file_path = static_file_path(self.static_root, path, query)
+        stat = await run_in_threadpool(stat_fresh, file_path, self.static_max_age)
+        if stat is None:
+            return None
+        etag = '"%x-%x"' % (stat.st_mtime_ns, stat.st_size)
+        headers = {"ETag": etag, "Last-Modified": http_date(int(stat.st_mtime))}
+        coding = self.get_encoding(request)
+        if is_not_modified(
+            request.headers, etag, datetime.fromtimestamp(int(stat.st_mtime), timezone.utc)
+        ):
+            return Response(
+                status_code=int(HTTPStatus.NOT_MODIFIED),
+                headers=self._response_headers(headers, coding),
+            )
+        if coding is not None:
+            encoded_path = static_file_path(self.static_root, path, query, coding)
+            encoded_stat = await run_in_threadpool(stat_fresh, encoded_path)
+            if encoded_stat is not None and encoded_stat.st_mtime >= stat.st_mtime:
+                file_path, stat = encoded_path, encoded_stat
+            else:
+                coding = None
+        return FileResponse(
+            file_path,
+            headers=self._response_headers(headers, coding),
+            media_type=feed_type.content_type,
+            stat_result=stat,
+        )
+
+    async def _get_validators(
+        self, obj: Any
+    ) -> Tuple[Optional[str], Optional[datetime], Dict[str, str]]:
         headers = {}
+        etag = await self.get_etag(obj)
+        if etag is not None:
+            etag = headers["ETag"] = quote_etag(etag)
+        last_modified = await self.get_last_modified(obj)
+        if last_modified is not None:
+            headers["Last-Modified"] = http_date(timegm(last_modified.utctimetuple()))
+        return etag, last_modified, headers
+
+    async def render(
+        self,
+        obj: Any,
+        request: Request,
+        headers: Optional[Dict[str, str]] = None,
+        codings: Optional[Sequence[str]] = None,
+    ) -> CachedFeed:
+        """
+        Return the fully serialized feed along with its response headers,
+        compressed with the given content codings (all of `compression` by
+        default).
+        """
+        feed_generator = await self.get_feed(obj, request)
+        return await self._render_feed(obj, request, feed_generator, headers, codings)
+
+    async def render_formats(
+        self,
+        obj: Any,
+        request: Request,
+        headers: Optional[Dict[str, str]] = None,
+        codings: Optional[Sequence[str]] = None,
+    ) -> Dict[str, CachedFeed]:
+        """
+        Like render, in each of feed_types, keyed by class name. The items
+        are fetched once and shared by every format.
+        """
         feed_generator = await self.get_feed(obj, request)
-        if hasattr(self, "item_pubdate") or hasattr(self, "item_updateddate"):
+        rendered = {}
+        for feed_type in self.feed_types:
+            converted = self._convert_feed(feed_generator, feed_type, request)
+            rendered[feed_type.__name__] = await self._render_feed(
+                obj, request, converted, headers, codings
+            )
+        return rendered
+
+    def _convert_feed(
+        self, feed_generator: SyndicationFeed, feed_type: Type[SyndicationFeed], request: Request
+    ) -> SyndicationFeed:
+        if type(feed_generator) is feed_type:
+            return feed_generator
+        converted = feed_generator.copy_as(feed_type)
+        name = request.path_params.get(self.format_param)
+        if name is not None and feed_type.format_name is not None:
+            # Point the links at the URLs of the format, e.g. /feed.json
+            feed = converted.feed
+            if feed["feed_url"] is not None:
+                feed["feed_url"] = _replace_format(feed["feed_url"], name, feed_type.format_name)
+            if "links" in feed:
+                feed["links"] = {
+                    rel: _replace_format(url, name, feed_type.format_name)
+                    for rel, url in feed["links"].items()
+                }
+        return converted
+
+    async def _render_feed(
+        self,
+        obj: Any,
+        request: Request,
+        feed_generator: SyndicationFeed,
+        headers: Optional[Dict[str, str]],
+        codings: Optional[Sequence[str]],
+    ) -> CachedFeed:
+        headers = dict(headers or {})
+        if "Last-Modified" not in headers and (
+            hasattr(self, "feed_updated")
+            or hasattr(self, "item_pubdate")
+            or hasattr(self, "item_updateddate")
+        ):
             headers["Last-Modified"] = http_date(
-                timegm(feed_generator.latest_post_date().utctimetuple())
+                timegm(feed_generator.updated_date().utctimetuple())
+            )
+        immutable = bool(feed_generator.feed.get("archive"))
+        if immutable:
+            headers["Cache-Control"] = "public, max-age=31536000, immutable"
+        elif self.delta_feeds and self.get_cursor(request) is None:
+            self._record_delta(obj, request, headers, feed_generator.updated_date())
+        if codings is None:
+            codings = available_codings(self.compression)
+        body, encodings = await self._serialize(feed_generator, codings)
+        return CachedFeed(
+            body, feed_generator.content_type, headers, encodings=encodings, immutable=immutable
+        )
+
+    async def _serialize(
+        self, feed_generator: SyndicationFeed, codings: Sequence[str]
+    ) -> Tuple[bytes, Dict[str, bytes]]:
+        item_count = len(feed_generator.items)
+        started = time.perf_counter()
+        if self.serialize_executor is not None and item_count >= self.serialize_executor_threshold:
+            executor = "process"
+            result = await get_running_loop().run_in_executor(
+                self.serialize_executor, _serialize_feed, feed_generator, codings
             )
-        feed = BytesIO()
-        feed_generator.write(feed, encoding="utf-8")
-        feed.seek(0)
-        return StreamingResponse(feed, media_type=feed_generator.content_type, headers=headers)
+        elif self.serialize_threshold is not None and item_count >= self.serialize_threshold:
+            executor = "thread"
+            result = await run_in_threadpool(_serialize_feed, feed_generator, codings)
+        else:
+            executor = "inline"
+            result = _serialize_feed(feed_generator, codings)
+        seconds = time.perf_counter() - started
+        self.report_serialization(item_count, seconds, executor)
+        if self._timings is not None:
+            self._timings.add_stage("serialize", started, seconds)
+            self._timings.item_count = item_count
+        body, encodings, sanitized_fields = result
+        if sanitized_fields:
+            self.report_sanitization(sanitized_fields)
+        return body, encodings
+
+    def report_serialization(self, item_count: int, seconds: float, executor: str) -> None:
+        """
+        Called once a feed is serialized and compressed, with its number of
+        items, the time it took and where it ran: "inline", "thread" or
+        "process". Override to record metrics.
+        """
+
+    def report_sanitization(self, field_count: int) -> None:
+        """
+        Called once a feed is serialized with the number of its text fields
+        that had control characters removed or replaced (see sanitize), if
+        any. Override to log or record metrics and fix the data upstream.
+        """
+
+    async def delta_response(
+        self,
+        obj: Any,
+        request: Request,
+        headers: Dict[str, str],
+        coding: Optional[str],
+        since: datetime,
+    ) -> Response:
+        """
+        Return a 226 IM Used response with the items of the feed changed
+        after `since`.
+        """
+        feed_generator = await self.get_feed(obj, request, since)
+        if "ETag" not in headers and not feed_generator.items:
+            # Nothing changed, so the client has the current feed
+            return Response(
+                status_code=int(HTTPStatus.NOT_MODIFIED),
+                headers=self._response_headers({"ETag": date_etag(since)}, coding),
+            )
+        headers = dict(headers, IM="feed")
+        # An empty delta leaves the feed as it was at `since`
+        updated = feed_generator.updated_date() if feed_generator.items else since
+        self._record_delta(obj, request, headers, updated)
+        body, encodings = await self._serialize(feed_generator, (coding,) if coding else ())
+        return Response(
+            encodings[coding] if coding else body,
+            status_code=int(HTTPStatus.IM_USED),
+            media_type=feed_generator.content_type,
+            headers=self._response_headers(headers, coding),
+        )
+
+    def _get_delta_since(self, obj: Any, request: Request) -> Optional[datetime]:
+        if_none_match = request.headers.get("if-none-match")
+        if not if_none_match or not accepts_feed_delta(request.headers.get("a-im", "")):
+            return None
+        if self._delta_index is None or self.get_cursor(request) is not None:
+            return None
+        return self._delta_index.lookup(
+            self.get_cache_key(obj, request), parse_etags(if_none_match)
+        )
+
+    def _record_delta(
+        self, obj: Any, request: Request, headers: Dict[str, str], updated: datetime
+    ) -> None:
+        """
+        Remember the time of the feed served with the ETag in the headers,
+        setting it if there is none.
+        """
+        cls = type(self)
+        if cls._delta_index is None:
+            cls._delta_index = DeltaIndex(self.delta_index_size)
+        if "ETag" not in headers:
+            headers["ETag"] = date_etag(updated)
+        cls._delta_index.record(self.get_cache_key(obj, request), headers["ETag"], updated)
+
+    def get_cursor(self, request: Request) -> Optional[Cursor]:
+        """
+        Return the cursor of the requested page, or None for the latest
+        items. Invalid cursors are answered with 400 Bad Request.
+        """
+        if self.page_size is None:
+            return None
+        value = request.query_params.get(self.cursor_param)
+        if value is None:
+            return None
+        try:
+            return decode_cursor(value)
+        except ValueError as exc:
+            raise HTTPException(int(HTTPStatus.BAD_REQUEST), detail=str(exc))
+
+    def get_encoding(self, request: Request) -> Optional[str]:
+        """
+        Return the content coding to send the feed with, according to the
+        request Accept-Encoding header, or None to send it uncompressed.
+        """
+        if not self.compression:
+            return None
+        return negotiate_encoding(
+            request.headers.get("accept-encoding", ""), available_codings(self.compression)
+        )
+
+    def get_feed_type(self, request: Request) -> Type[SyndicationFeed]:
+        """
+        Return the generator class of the requested format, see feed_types.
+        Unknown formats in the path are answered with 404 Not Found.
+        """
+        if not self.feed_types:
+            return self.feed_type
+        name = request.path_params.get(self.format_param)
+        if name is not None:
+            for feed_type in self.feed_types:
+                if feed_type.format_name == name:
+                    return feed_type
+            raise HTTPException(int(HTTPStatus.NOT_FOUND), detail="Unknown feed format")
+        index = negotiate_media_type(
+            request.headers.get("accept", ""),
+            [feed_type.content_type.partition(";")[0] for feed_type in self.feed_types],
+        )
+        return self.feed_types[index or 0]
+
+    def _negotiates_format(self) -> bool:
+        return bool(self.feed_types) and self.format_param not in self.scope.get("path_params", {})
+
+    def _response_headers(self, headers: Dict[str, str], coding: Optional[str]) -> Dict[str, str]:
+        vary = []
+        if self._negotiates_format():
+            vary.append("Accept")
+        if self.compression:
+            vary.append("Accept-Encoding")
+        if not vary:
+            return headers
+        headers = dict(headers, Vary=", ".join(vary))
+        if coding is not None:
+            headers["Content-Encoding"] = coding
+            etag = headers.get("ETag")
+            if etag is not None and not etag.startswith("W/"):
+                # The compressed representation is not byte-for-byte the
+                # one the strong ETag was computed for
+                headers["ETag"] = "W/" + etag
+        return headers
+
+    def get_cache_key(self, obj: Any, request: Request) -> str:
+        """
+        Return the key the rendered feed is cached under. It is derived from
+        the same inputs get_feed uses, so it is stable across processes.
+        """
+        path = request.url.path
+        name = request.path_params.get(self.format_param) if self.feed_types else None
+        if name is not None:
+            # Every format is cached under the same key, see render_formats
+            path = _replace_format(path, name, "{%s}" % self.format_param)
+        return self.build_cache_key(
+            self._get_dynamic_attr("feed_url", obj) or path,
+            request.url.is_secure,
+            request.url.query,
+        )
+
+    @classmethod
+    def build_cache_key(cls, feed_url: str, secure: bool = False, query: str = "") -> str:
+        return "%s.%s:%s:%s:%s:%s?%s" % (
+            cls.__module__,
+            cls.__qualname__,
+            "+".join(feed_type.__name__ for feed_type in cls.feed_types) or cls.feed_type.__name__,
+            cls.domain or "",
+            "https" if secure else "http",
+            feed_url,
+            cls._cache_query(query),
+        )
+
+    @classmethod
+    def _cache_query(cls, query: str) -> str:
+        """
+        Return the query string the feed is cached under: cache_query_params
+        and the cursor, in its canonical encoding, sorted.
+        """
+        if cls.cache_query_params is None:
+            return query
+        params = []
+        for name, value in parse_qsl(query, keep_blank_values=True):
+            if cls.page_size is not None and name == cls.cursor_param:
+                try:
+                    value = encode_cursor(decode_cursor(value))
+                except ValueError:
+                    pass
+            elif name not in cls.cache_query_params:
+                continue
+            params.append((name, value))
+        return urlencode(sorted(params))
+
+    @classmethod
+    async def invalidate(cls, feed_url: str, query: str = "") -> None:
+        """
+        Drop the cached feed for the given feed URL (request path unless
+        feed_url is defined; the route path, e.g. "/feed.{format}", for a
+        format in the path) and query, e.g. when new content is published.
+        """
+        if cls.cache is None:
+            return
+        keys = [cls.build_cache_key(feed_url, secure, query) for secure in (False, True)]
+        if cls.feed_types:
+            keys = [
+                cls.cache.variant_key(key, feed_type.__name__)
+                for key in keys
+                for feed_type in cls.feed_types
+            ]
+        await cls.cache.invalidate(*keys)
+
+    @classmethod
+    async def notify_updated(cls, feed_url: str, query: str = "", secure: bool = True) -> None:
+        """
+        Drop the cached feed (see invalidate) and notify websub_hubs that it
+        was updated, in the background. The topic is the feed self link:
+        feed_url made absolute for domain, in every format for a format in
+        the path (e.g. "/feed.{format}").
+        """
+        await cls.invalidate(feed_url, query)
+        if not cls.websub_hubs:
+            return
+        assert cls.websub_publisher is not None, "websub_publisher is not set"
+        if query:
+            feed_url += "?" + query
+        placeholder = "{%s}" % cls.format_param
+        if cls.feed_types and placeholder in feed_url:
+            urls = [
+                feed_url.replace(placeholder, feed_type.format_name)
+                for feed_type in cls.feed_types
+                if feed_type.format_name is not None
+            ]
+        else:
+            urls = [feed_url]
+        for url in urls:
+            cls.websub_publisher.notify(add_domain(cls.domain, url, secure), cls.websub_hubs)
+
+    def stream_feed(
+        self,
+        obj: Any,
+        request: Request,
+        headers: Optional[Dict[str, str]] = None,
+        coding: Optional[str] = None,
+    ) -> StreamingResponse:
+        """
+        Return a response that sends the feed header right away and then
+        serializes every item as soon as get_items yields it, compressed
+        with the given content coding if any.
+        """
+        feed = self.create_feed(obj, request)
+        headers = dict(headers or {})
+        updated = feed.feed["updateddate"]
+        if updated is not None and "Last-Modified" not in headers:
+            headers["Last-Modified"] = http_date(timegm(updated.utctimetuple()))
+        chunks = self._stream_chunks(feed, request.url.is_secure)
+        if coding is not None:
+            chunks = _compress_chunks(chunks, Compressor(coding))
+        return StreamingResponse(
+            chunks,
+            media_type=feed.content_type,
+            headers=self._response_headers(headers, coding),
+        )
 
     async def get_object(self, request: Request, *args: Any, **kwargs: Any) -> Any:
         ...
 
+    async def get_etag(self, obj: Any) -> Optional[str]:
+        """
+        Return an ETag for the feed of the given object, or None. Called
+        before get_items, so it should be cheap: a matching If-None-Match
+        request is answered with 304 Not Modified without rendering the feed.
+        """
+        return None
+
+    async def get_last_modified(self, obj: Any) -> Optional[datetime]:
+        """
+        Return the time the feed of the given object last changed, or None.
+        Like get_etag, it is used to answer conditional requests before
+        get_items is called.
+        """
+        return None
+
     def item_link(self, item: Any) -> str:
         return getattr(item, "link", self.link)
 
@@ -54,31 +829,17 @@ class FeedEndpoint(HTTPEndpoint, ABC):
         return getattr(item, "description", None) or str(item)
 
     def item_enclosures(self, item: Any) -> Iterable[Enclosure]:
-        enc_url = self._get_dynamic_attr("item_enclosure_url", item)
-        if not enc_url:
-            return []
-        enc = Enclosure(
-            url=str(enc_url),
-            length=str(self._get_dynamic_attr("item_enclosure_length", item)),
-            mime_type=str(self._get_dynamic_attr("item_enclosure_mime_type", item)),
-        )
-        return [enc]
+        return _item_enclosures(self._get_dynamic_attr, item)
 
     def _get_dynamic_attr(self, attname: str, obj: Any, default: Any = None) -> Any:
-        attr = getattr(self, attname, default)
-        if not callable(attr):
-            return attr
-        # Check co_argcount rather than try/excepting the function and
-        # catching the TypeError, because something inside the function
-        # may raise the TypeError. This technique is more accurate.
+        if attname in self.__dict__:
+            # Set on the instance, so the per-class plan does not apply
+            return _call_dynamic_attr(self.__dict__[attname], obj, default)
         try:
-            code = attr.__code__
-        except AttributeError:
-            code = attr.__call__.__code__
-        args = ()
-        if code.co_argcount == 2:  # one argument is 'self'
-            args = (obj,)
-        return attr(*args)
+            resolver = self._attr_resolvers[attname]
+        except KeyError:
+            resolver = self._attr_resolvers[attname] = _compile_dynamic_attr(type(self), attname)
+        return resolver(self, obj, default)
 
     def feed_extra_kwargs(self, obj: Any) -> Dict[str, Any]:
         """
@@ -94,16 +855,118 @@ class FeedEndpoint(HTTPEndpoint, ABC):
         """
         return {}
 
-    async def get_feed(self, obj: Any, request: Request) -> SyndicationFeed:
+    def items_extra_kwargs(self, items: List[Any]) -> List[Dict[str, Any]]:
+        """
+        Return a list of extra keyword arguments dictionaries, one for each
+        of a batch of items (see item_batch_size). Override to look up extra
+        data for the whole batch at once, e.g. with a single database query;
+        by default item_extra_kwargs is called for each item.
+        """
+        return [self.item_extra_kwargs(item) for item in items]
+
+    async def get_feed(
+        self, obj: Any, request: Request, since: Optional[datetime] = None
+    ) -> SyndicationFeed:
         """
         Return a SyndicationFeed object, fully populated, for
         this feed. Raise FeedDoesNotExist for invalid parameters.
+        With `since`, only items changed after that time are included.
+        """
+        feed = self.create_feed(obj, request)
+        with self._stage("items"):
+            if since is not None:
+                await self._populate_delta(feed, request, since)
+            elif self.page_size is not None:
+                await self._populate_page(feed, request)
+            else:
+                async for batch_kwargs in self._iter_batch_kwargs(request.url.is_secure):
+                    for item_kwargs in batch_kwargs:
+                        feed.add_item(**item_kwargs)
+        return feed
+
+    async def _populate_delta(
+        self, feed: SyndicationFeed, request: Request, since: datetime
+    ) -> None:
+        request_is_secure = request.url.is_secure
+        if "since" in self._get_items_params():
+            batches = self._iter_batches(since=since)
+            filter_items = False
+        else:
+            batches = self._iter_batches()
+            filter_items = True
+        async for batch in batches:
+            for item_kwargs in await self._get_batch_kwargs(batch, request_is_secure):
+                if filter_items:
+                    changed = item_kwargs["updateddate"] or item_kwargs["pubdate"]
+                    if changed is None or changed <= since:
+                        continue
+                feed.add_item(**item_kwargs)
+
+    async def _populate_page(self, feed: SyndicationFeed, request: Request) -> None:
+        """
+        Add the items of the requested page to the feed, along with the
+        RFC 5005 links to the other pages.
+        """
+        assert self.page_size is not None
+        cursor = self.get_cursor(request)
+        request_is_secure = request.url.is_secure
+        accepted = self._get_items_params()
+        params: Dict[str, Any] = {}
+        if "limit" in accepted:
+            # One more item tells whether there is a next page
+            params["limit"] = self.page_size + 1
+        if "cursor" in accepted:
+            params["cursor"] = cursor
+        skip_to_cursor = cursor is not None and "cursor" not in accepted
+        if not skip_to_cursor:
+            params["max_items"] = self.page_size + 1
+        last = None
+        more = False
+        async for batch in self._iter_batches(**params):
+            for item_kwargs in await self._get_batch_kwargs(batch, request_is_secure):
+                if skip_to_cursor and not follows(item_kwargs, cursor):
+                    continue
+                if feed.num_items() >= self.page_size:
+                    more = True
+                    break
+                feed.add_item(**item_kwargs)
+                last = item_kwargs
+            if more:
+                break
+
+        feed_url = feed.feed["feed_url"]
+        query = [
+            (name, value)
+            for name, value in request.query_params.multi_items()
+            if name != self.cursor_param
+            and (self.cache_query_params is None or name in self.cache_query_params)
+        ]
+
+        def page_url(page_cursor: Optional[Cursor]) -> str:
+            page_query = query
+            if page_cursor is not None:
+                page_query = query + [(self.cursor_param, encode_cursor(page_cursor))]
+            return feed_url + "?" + urlencode(page_query) if page_query else feed_url
+
+        next_cursor = item_cursor(last) if more and last is not None else None
+        links = {}
+        if cursor is not None:
+            feed.feed["feed_url"] = page_url(cursor)
+            links["current" if self.archive_pages else "first"] = page_url(None)
+        if next_cursor is not None:
+            links["prev-archive" if self.archive_pages else "next"] = page_url(next_cursor)
+        feed.feed["links"] = links
+        feed.feed["archive"] = self.archive_pages and cursor is not None
+
+    def create_feed(self, obj: Any, request: Request) -> SyndicationFeed:
+        """
+        Return a SyndicationFeed object without any items.
         """
         link = self._get_dynamic_attr("link", obj)
         request_is_secure = request.url.is_secure
         link = add_domain(self.domain, link, request_is_secure)
 
-        feed = self.feed_type(
+        feed = self.get_feed_type(request)(
             title=self._get_dynamic_attr("title", obj),
             subtitle=self._get_dynamic_attr("subtitle", obj),
             link=link,
@@ -121,54 +984,468 @@ class FeedEndpoint(HTTPEndpoint, ABC):
             feed_copyright=self._get_dynamic_attr("feed_copyright", obj),
             feed_guid=self._get_dynamic_attr("feed_guid", obj),
             ttl=self._get_dynamic_attr("ttl", obj),
+            updateddate=self._get_dynamic_attr("feed_updated", obj),
             **self.feed_extra_kwargs(obj),
         )
+        if self.websub_hubs:
+            feed.feed["hubs"] = list(self.websub_hubs)
+        if self.sanitize != feed.sanitize:
+            feed.sanitize = self.sanitize
+        if self.fragment_cache is not None:
+            feed.fragment_cache = self.fragment_cache
+            feed.fragment_namespace = self.get_cache_key(obj, request)
+        return feed
 
-        items = await run_async_or_thread(self.get_items)
-        if isinstance(items, AsyncIterable):
+    async def _iter_items(
+        self, max_items: Optional[int] = None, **params: Any
+    ) -> AsyncIterator[Any]:
+        """
+        Yield the items of get_items, called with the given parameters. After
+        max_items items, the iteration stops and the iterator is closed.
+        """
+        if max_items is not None and max_items <= 0:
+            return
+        items = await run_async_or_thread(self.get_items, **params)
+        count = 0
+        self._async_items = isinstance(items, AsyncIterable)
+        if self._async_items:
+            iterator = items.__aiter__()
+            try:
+                async for item in iterator:
+                    yield item
+                    count += 1
+                    if count == max_items:
+                        break
+            finally:
+                if hasattr(iterator, "aclose"):
+                    await iterator.aclose()
+        else:
+            iterator = iter(items)
+            try:
+                for item in iterator:
+                    yield item
+                    count += 1
+                    if count == max_items:
+                        break
+            finally:
+                if hasattr(iterator, "close"):
+                    iterator.close()
+
+    async def _iter_batches(
+        self, flush_interval: Optional[float] = None, **params: Any
+    ) -> AsyncIterator[List[Any]]:
+        """
+        Yield the items of get_items in lists of item_batch_size items. With
+        flush_interval, a batch is also yielded once its first item waited
+        that many seconds for the next one from an async get_items.
+        """
+        items = self._iter_items(**params)
+        batch: List[Any] = []
+        if flush_interval is not None:
             async for item in items:
-                await self._populate_feed(feed, item, request_is_secure)
+                batch.append(item)
+                if self._async_items:
+                    # Items may be slow to come: switch to timed batches
+                    async for batch in self._iter_timed_batches(items, batch, flush_interval):
+                        yield batch
+                    return
+                if len(batch) >= self.item_batch_size:
+                    yield batch
+                    batch = []
         else:
-            for item in items:
-                await self._populate_feed(feed, item, request_is_secure)
-        return feed
+            async for item in items:
+                batch.append(item)
+                if len(batch) >= self.item_batch_size:
+                    yield batch
+                    batch = []
+        if batch:
+            yield batch
+
+    async def _iter_timed_batches(
+        self, items: AsyncGenerator[Any, None], batch: List[Any], flush_interval: float
+    ) -> AsyncIterator[List[Any]]:
+        loop = get_running_loop()
+        deadline = loop.time() + flush_interval
+        # The next item is awaited in a task while a batch is pending, so
+        # that waiting for it can time out without cancelling get_items
+        pending: Optional["Future[Any]"] = None
+        try:
+            while True:
+                if not batch:
+                    # Nothing to send: wait for the next item as long as it takes
+                    next_item, pending = pending, None
+                    try:
+                        if next_item is None:
+                            batch.append(await items.__anext__())
+                        else:
+                            batch.append(await next_item)
+                    except StopAsyncIteration:
+                        break
+                    deadline = loop.time() + flush_interval
+                else:
+                    if pending is None:
+                        pending = ensure_future(items.__anext__())
+                    done, _ = await wait((pending,), timeout=max(deadline - loop.time(), 0))
+                    if not done:
+                        yield batch
+                        batch = []
+                        continue
+                    next_item, pending = pending, None
+                    try:
+                        batch.append(next_item.result())
+                    except StopAsyncIteration:
+                        break
+                if len(batch) >= self.item_batch_size:
+                    yield batch
+                    batch = []
+            if batch:
+                yield batch
+        finally:
+            if pending is not None:
+                pending.cancel()
+                await gather(pending, return_exceptions=True)
+            await items.aclose()
+
+    async def _iter_batch_kwargs(
+        self, request_is_secure: bool, flush_interval: Optional[float] = None
+    ) -> AsyncIterator[List[Dict[str, Any]]]:
+        """
+        Yield the add_item keyword arguments of the items of the feed, one
+        batch at a time, applying max_items and order_by. See _iter_batches
+        for flush_interval.
+        """
+        accepted = self._get_items_params()
+        if self.order_by is None or "order_by" in accepted:
+            params: Dict[str, Any] = {}
+            if self.max_items is not None and "limit" in accepted:
+                params["limit"] = self.max_items
+            if self.order_by is not None:
+                params["order_by"] = self.order_by
+            async for batch in self._iter_batches(
+                flush_interval, max_items=self.max_items, **params
+            ):
+                yield await self._get_batch_kwargs(batch, request_is_secure)
+            return
+        # Unordered items, all of which are read: keep the max_items newest
+        # in a min-heap. Ties keep the order of get_items.
+        params = {"limit": None} if "limit" in accepted else {}
+        heap: List[Tuple[Tuple[bool, Any], int, Any]] = []
+        order = 0
+        hook = ORDER_HOOKS.get(self.order_by)
+        if hook is None or self._has_extra_kwargs():
+            # The value is only known from the add_item arguments
+            async for batch in self._iter_batches(**params):
+                for item_kwargs in await self._get_batch_kwargs(batch, request_is_secure):
+                    value = item_kwargs.get(self.order_by)
+                    order = self._push_ordered(heap, value, order, item_kwargs)
+            heap.sort(reverse=True)
+            yield [item_kwargs for _, _, item_kwargs in heap]
+            return
+        # Select on the hook, and only then render the items that are kept
+        semaphore = Semaphore(self.max_item_concurrency)
+
+        async def resolve(item: Any) -> Any:
+            async with semaphore:
+                return await self._resolve_item_hook(hook, item)
+
+        async for batch in self._iter_batches(**params):
+            values = await gather(*(resolve(item) for item in batch))
+            for item, value in zip(batch, values):
+                order = self._push_ordered(heap, value, order, item)
+        heap.sort(reverse=True)
+        items = [item for _, _, item in heap]
+        size = self.item_batch_size
+        for start in range(0, len(items), size):
+            end = start + size
+            yield await self._get_batch_kwargs(items[start:end], request_is_secure)
+
+    def _push_ordered(
+        self, heap: List[Tuple[Tuple[bool, Any], int, Any]], value: Any, order: int, entry: Any
+    ) -> int:
+        """
+        Push the entry on the heap of the max_items newest entries, at its
+        order in get_items. Return the order of the next entry.
+        """
+        key = ((value is not None, value), order, entry)
+        if self.max_items is None or len(heap) < self.max_items:
+            heappush(heap, key)
+        elif key[:2] > heap[0][:2]:
+            _, _, dropped = heapreplace(heap, key)
+            self._pop_resolved_hooks(dropped)
+        else:
+            self._pop_resolved_hooks(entry)
+        return order - 1
+
+    async def _stream_chunks(
+        self, feed: SyndicationFeed, request_is_secure: bool
+    ) -> AsyncIterator[bytes]:
+        writer = FeedStreamWriter(feed, encoding="utf-8")
+        yield writer.start()
+        item_count = 0
+        async for batch_kwargs in self._iter_batch_kwargs(
+            request_is_secure, self.stream_flush_interval
+        ):
+            item_count += len(batch_kwargs)
+            yield b"".join(
+                [writer.write_item(feed.make_item(**item_kwargs)) for item_kwargs in batch_kwargs]
+            )
+        if self._timings is not None:
+            self._timings.item_count = item_count
+        end = writer.end()
+        if feed.sanitized_fields:
+            self.report_sanitization(feed.sanitized_fields)
+        yield end
 
     async def _populate_feed(
         self, feed: SyndicationFeed, item: Any, request_is_secure: bool = True
     ) -> None:
-        title = self._get_dynamic_attr("item_title", item)
-        description = self._get_dynamic_attr("item_description", item)
-        link = add_domain(
-            self.domain, self._get_dynamic_attr("item_link", item), request_is_secure,
+        for item_kwargs in await self._get_batch_kwargs([item], request_is_secure):
+            feed.add_item(**item_kwargs)
+
+    async def _get_batch_kwargs(
+        self, batch: List[Any], request_is_secure: bool
+    ) -> List[Dict[str, Any]]:
+        """
+        Return add_item keyword arguments for each item of the batch.
+        """
+        async_hooks = self._get_async_item_hooks()
+        if async_hooks:
+            semaphore = Semaphore(self.max_item_concurrency)
+
+            async def get_item_kwargs(item: Any) -> Dict[str, Any]:
+                resolved = self._pop_resolved_hooks(item) or {}
+                hooks = [attname for attname in async_hooks if attname not in resolved]
+                async with semaphore:
+                    values = await gather(
+                        *(self._get_dynamic_attr(attname, item) for attname in hooks)
+                    )
+                resolved.update(zip(hooks, values))
+                return self._get_item_kwargs(item, request_is_secure, resolved)
+
+            # gather keeps the results in the order of the items
+            batch_kwargs = await gather(*(get_item_kwargs(item) for item in batch))
+        else:
+            batch_kwargs = [self._get_item_kwargs(item, request_is_secure) for item in batch]
+        extra_kwargs = await self._get_extra_kwargs(batch)
+        if extra_kwargs is not None:
+            for item_kwargs, extra in zip(batch_kwargs, extra_kwargs):
+                item_kwargs.update(extra)
+        return batch_kwargs
+
+    def _has_extra_kwargs(self) -> bool:
+        cls = type(self)
+        return (
+            cls.items_extra_kwargs is not FeedEndpoint.items_extra_kwargs
+            or cls.item_extra_kwargs is not FeedEndpoint.item_extra_kwargs
         )
-        enclosures = self._get_dynamic_attr("item_enclosures", item)
-        author_name = self._get_dynamic_attr("item_author_name", item)
+
+    async def _get_extra_kwargs(self, batch: List[Any]) -> Optional[List[Dict[str, Any]]]:
+        if not self._has_extra_kwargs():
+            # Nothing to add, skip the threadpool round-trip altogether
+            return None
+        if type(self).items_extra_kwargs is not FeedEndpoint.items_extra_kwargs:
+            return await run_async_or_thread(self.items_extra_kwargs, batch)
+        if iscoroutinefunction(self.item_extra_kwargs):
+            return [await self.item_extra_kwargs(item) for item in batch]
+        # One threadpool round-trip for the whole batch
+        return await run_in_threadpool(self.items_extra_kwargs, batch)
+
+    async def _resolve_item_hook(self, attname: str, item: Any) -> Any:
+        """
+        Return the value of an item hook ahead of rendering. Values of async
+        hooks are kept until the item is rendered, so that they are only
+        awaited once.
+        """
+        if attname not in self._get_async_item_hooks():
+            value = self._get_dynamic_attr(attname, item)
+            if inspect.isawaitable(value):
+                value = await value
+            return value
+        if self._resolved_hooks is None:
+            self._resolved_hooks = {}
+        # The item is kept alongside so that its id is not reused
+        _, values = self._resolved_hooks.setdefault(id(item), (item, {}))
+        if attname not in values:
+            values[attname] = await self._get_dynamic_attr(attname, item)
+        return values[attname]
+
+    def _pop_resolved_hooks(self, item: Any) -> Optional[Dict[str, Any]]:
+        """
+        Return the values of async hooks awaited by _resolve_item_hook for
+        the item, if any, forgetting them.
+        """
+        if not self._resolved_hooks:
+            return None
+        _, values = self._resolved_hooks.pop(id(item), (None, None))
+        return values
+
+    def _get_items_params(self) -> FrozenSet[str]:
+        cls = type(self)
+        if cls._items_params is None:
+            parameters = inspect.signature(self.get_items).parameters.values()
+            if any(parameter.kind is parameter.VAR_KEYWORD for parameter in parameters):
+                cls._items_params = frozenset(("limit", "cursor", "since", "order_by"))
+            else:
+                cls._items_params = frozenset(parameter.name for parameter in parameters)
+        return cls._items_params
+
+    def _get_async_item_hooks(self) -> Tuple[str, ...]:
+        cls = type(self)
+        if cls._async_item_hooks is None:
+            cls._async_item_hooks = tuple(
+                attname
+                for attname in ITEM_HOOKS
+                if iscoroutinefunction(getattr(cls, attname, None))
+            )
+        return cls._async_item_hooks
+
+    def _get_item_kwargs(
+        self, item: Any, request_is_secure: bool = True, resolved: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """
+        Return add_item keyword arguments for the item. Values of async
+        hooks are looked up in `resolved`, as they have been awaited already.
+        """
+        if resolved:
+            values = resolved
+
+            def get(attname: str, obj: Any, default: Any = None) -> Any:
+                if attname in values:
+                    return values[attname]
+                return self._get_dynamic_attr(attname, obj, default)
+
+        else:
+            get = self._get_dynamic_attr
+
+        title = get("item_title", item)
+        description = get("item_description", item)
+        link = url_normalizer(self.domain, request_is_secure)(get("item_link", item))
+        if type(self).item_enclosures is FeedEndpoint.item_enclosures:
+            # With the item_enclosure_* values awaited already, if async
+            enclosures = _item_enclosures(get, item)
+        else:
+            enclosures = get("item_enclosures", item)
+        author_name = get("item_author_name", item)
         if author_name is not None:
-            author_email = self._get_dynamic_attr("item_author_email", item)
-            author_link = self._get_dynamic_attr("item_author_link", item)
+            author_email = get("item_author_email", item)
+            author_link = get("item_author_link", item)
         else:
             author_email = author_link = None
 
-        pubdate = self._get_dynamic_attr("item_pubdate", item)
-        updateddate = self._get_dynamic_attr("item_updateddate", item)
-        extra_kwargs = await run_async_or_thread(self.item_extra_kwargs, item)
-        feed.add_item(
+        pubdate = get("item_pubdate", item)
+        updateddate = get("item_updateddate", item)
+        return dict(
             title=title,
             link=link,
             description=description,
-            unique_id=self._get_dynamic_attr("item_guid", item, link),
-            unique_id_is_permalink=self._get_dynamic_attr("item_guid_is_permalink", item),
+            unique_id=get("item_guid", item, link),
+            unique_id_is_permalink=get("item_guid_is_permalink", item),
             enclosures=enclosures,
             pubdate=pubdate,
             updateddate=updateddate,
             author_name=author_name,
             author_email=author_email,
             author_link=author_link,
-            categories=self._get_dynamic_attr("item_categories", item),
-            item_copyright=self._get_dynamic_attr("item_copyright", item),
-            **extra_kwargs,
+            categories=get("item_categories", item),
+            item_copyright=get("item_copyright", item),
+            version=get("item_version", item),
         )
 
 
 class FeedDoesNotExist(Exception):
     ...
+
+
+def _item_enclosures(get: Callable[..., Any], item: Any) -> List[Enclosure]:
+    enc_url = get("item_enclosure_url", item)
+    if not enc_url:
+        return []
+    enc = Enclosure(
+        url=str(enc_url),
+        length=str(get("item_enclosure_length", item)),
+        mime_type=str(get("item_enclosure_mime_type", item)),
+    )
+    return [enc]
+
+
+def _call_dynamic_attr(attr: Any, obj: Any, default: Any = None) -> Any:
+    if not callable(attr):
+        return attr
+    # Check co_argcount rather than try/excepting the function and
+    # catching the TypeError, because something inside the function
+    # may raise the TypeError. This technique is more accurate.
+    try:
+        code = attr.__code__
+    except AttributeError:
+        code = attr.__call__.__code__
+    args = ()
+    if code.co_argcount == 2:  # one argument is 'self'
+        args = (obj,)
+    return attr(*args)
+
+
+def _compile_dynamic_attr(
+    cls: Type[FeedEndpoint], attname: str
+) -> Callable[[FeedEndpoint, Any, Any], Any]:
+    """
+    Return a function resolving the dynamic attribute for an instance of the
+    class, an object and a default. getattr/callable/co_argcount checks are
+    done here once instead of for every item.
+    """
+    attr = inspect.getattr_static(cls, attname, _MISSING)
+    if attr is _MISSING and not hasattr(cls, "__getattr__"):
+        return lambda self, obj, default: default
+    if isinstance(attr, FunctionType):
+        # A plain method: call the function directly instead of binding it
+        if attr.__code__.co_argcount == 2:
+            return lambda self, obj, default: attr(self, obj)
+        return lambda self, obj, default: attr(self)
+    if attr is not _MISSING and not callable(attr) and not hasattr(type(attr), "__get__"):
+        return lambda self, obj, default: attr
+    # Properties, static and class methods, callable objects etc.
+    return lambda self, obj, default: _call_dynamic_attr(getattr(self, attname, default), obj)
+
+
+_MISSING = object()
+
+
+def _parse_last_modified(headers: Dict[str, str]) -> Optional[datetime]:
+    last_modified = headers.get("Last-Modified")
+    if last_modified is None:
+        return None
+    seconds = parse_http_date(last_modified)
+    return None if seconds is None else datetime.fromtimestamp(seconds, timezone.utc)
+
+
+async def _send_nothing(message: Dict[str, Any]) -> None:
+    ...
+
+
+def _serialize_feed(
+    feed_generator: SyndicationFeed, codings: Sequence[str]
+) -> Tuple[bytes, Dict[str, bytes], int]:
+    # Module level, so that it can be run in a process pool. The count of
+    # sanitized fields is returned as the feed is a copy in that case.
+    sanitized_fields = feed_generator.sanitized_fields
+    feed = BytesIO()
+    feed_generator.write(feed, encoding="utf-8")
+    body = feed.getvalue()
+    encodings = {coding: compress(body, coding) for coding in codings}
+    return body, encodings, feed_generator.sanitized_fields - sanitized_fields
+
+
+async def _compress_chunks(
+    chunks: AsyncIterator[bytes], compressor: Compressor
+) -> AsyncIterator[bytes]:
+    # Flush after every chunk, so the client can process the items sent so far
+    async for chunk in chunks:
+        yield compressor.compress(chunk) + compressor.flush()
+    yield compressor.finish()
+
+
+def _replace_format(url: str, name: str, new_name: str) -> str:
+    # Replace the format name ending the path, e.g. /feed.rss -> /feed.json
+    path, sep, query = url.partition("?")
+    if name and path.endswith(name):
+        path = path[: -len(name)] + new_name
+    return path + sep + query
@@ -21,17 +21,59 @@ For definitions of the different versions of RSS, see:
 https://web.archive.org/web/20110718035220/http://diveintomark.org/archives/2004/02/04/incompatible-rss
 """
 import datetime
-from io import StringIO
-
-from .utils import SimplerXMLGenerator, get_tag_uri, iri_to_uri, rfc2822_date, rfc3339_date
+import itertools
+from io import BytesIO, StringIO
+
+from .paging import HISTORY_NS
+from .utils import (
+    SimplerXMLGenerator,
+    XMLWriter,
+    get_tag_uri,
+    iri_to_uri,
+    json_dumps,
+    rfc2822_date,
+    rfc3339_date,
+)
 
 utc = datetime.timezone.utc
 
+# Methods that write XML through the handler. If a feed class overrides any of
+# them, the override may rely on XMLGenerator internals, so it is only written
+# with XMLWriter when it opts in with fast_xml_writer = True.
+HANDLER_METHODS = (
+    "write",
+    "start_feed",
+    "end_feed",
+    "write_items",
+    "write_item",
+    "add_root_elements",
+    "add_item_elements",
+    "endChannelElement",
+)
+
 
 class SyndicationFeed:
     "Base class for all syndication feeds. Subclasses should provide write()"
 
     content_type: str
+    # Name of the format, e.g. as a URL suffix (see FeedEndpoint.feed_types)
+    format_name = None
+    # Written between items, for formats that need one
+    item_separator = ""
+    # Whether to write XML with XMLWriter rather than SimplerXMLGenerator.
+    # None means only when no method writing XML is overridden outside this module.
+    fast_xml_writer = None
+    # Serialized items are kept in this FragmentCache, if set, and reused by
+    # later renders as long as their guid and version do not change. Items
+    # are cached per fragment_namespace, which must identify everything
+    # besides the item that its serialization depends on.
+    fragment_cache = None
+    fragment_namespace = ""
+    # How text with control characters (not allowed in XML 1.0) is written,
+    # see utils.SANITIZE_POLICIES. sanitized_fields counts the text fields
+    # and attribute values that were fixed while writing the feed.
+    sanitize = "strict"
+    sanitized_fields = 0
 
     def __init__(
         self,
@@ -48,6 +90,7 @@ class SyndicationFeed:
         feed_copyright=None,
         feed_guid=None,
         ttl=None,
+        updateddate=None,
         **kwargs,
     ):
         def to_str(s):
@@ -68,11 +111,25 @@ class SyndicationFeed:
             "feed_copyright": to_str(feed_copyright),
             "id": feed_guid or link,
             "ttl": to_str(ttl),
+            "updateddate": updateddate,
             **kwargs,
         }
         self.items = []
+        # Latest item date among the first _dated_items items, see latest_post_date()
+        self._latest_date = None
+        self._dated_items = 0
 
-    def add_item(
+    def add_item(self, *args, **kwargs):
+        """
+        Add an item to the feed. See make_item() for the accepted arguments.
+        """
+        item = self.make_item(*args, **kwargs)
+        self.items.append(item)
+        if self._dated_items == len(self.items) - 1:
+            self._latest_date = _latest_date(self._latest_date, item)
+            self._dated_items += 1
+
+    def make_item(
         self,
         title,
         link,
@@ -89,37 +146,39 @@ class SyndicationFeed:
         ttl=None,
         updateddate=None,
         enclosures=None,
+        version=None,
         **kwargs,
     ):
         """
-        Add an item to the feed. All args are expected to be strings except
-        pubdate and updateddate, which are datetime.datetime objects, and
-        enclosures, which is an iterable of instances of the Enclosure class.
+        Build an item without adding it to the feed. All args are expected to
+        be strings except pubdate and updateddate, which are datetime.datetime
+        objects, and enclosures, which is an iterable of instances of the
+        Enclosure class. `version` is any value that changes whenever the
+        item does, see fragment_key().
         """
 
         def to_str(s):
             return str(s) if s is not None else s
 
         categories = categories and [to_str(c) for c in categories]
-        self.items.append(
-            {
-                "title": to_str(title),
-                "link": iri_to_uri(link),
-                "description": to_str(description),
-                "author_email": to_str(author_email),
-                "author_name": to_str(author_name),
-                "author_link": iri_to_uri(author_link),
-                "pubdate": pubdate,
-                "updateddate": updateddate,
-                "comments": to_str(comments),
-                "unique_id": to_str(unique_id),
-                "unique_id_is_permalink": unique_id_is_permalink,
-                "enclosures": enclosures or (),
-                "categories": categories or (),
-                "item_copyright": to_str(item_copyright),
-                "ttl": to_str(ttl),
-                **kwargs,
-            }
+        return FeedItem(
+            to_str(title),
+            iri_to_uri(link),
+            to_str(description),
+            to_str(author_email),
+            to_str(author_name),
+            iri_to_uri(author_link),
+            pubdate,
+            updateddate,
+            to_str(comments),
+            to_str(unique_id),
+            unique_id_is_permalink,
+            enclosures or (),
+            categories or (),
+            to_str(item_copyright),
+            to_str(ttl),
+            version,
+            kwargs or None,
         )
 
     def num_items(self):
@@ -158,6 +217,104 @@ class SyndicationFeed:
         """
         raise NotImplementedError("subclasses of SyndicationFeed must provide a write() method")
 
+    def get_xml_writer(self, outfile, encoding):
+        """
+        Return the handler the feed is written with.
+        """
+        if self._uses_fast_xml_writer():
+            return XMLWriter(outfile, encoding, self.sanitize, self._count_sanitized)
+        return SimplerXMLGenerator(
+            outfile, encoding, sanitize=self.sanitize, on_sanitize=self._count_sanitized
+        )
+
+    def _count_sanitized(self):
+        self.sanitized_fields += 1
+
+    @classmethod
+    def _uses_fast_xml_writer(cls):
+        if cls.fast_xml_writer is not None:
+            return cls.fast_xml_writer
+        uses_fast = _fast_xml_writer_classes.get(cls)
+        if uses_fast is None:
+            uses_fast = _fast_xml_writer_classes[cls] = all(
+                getattr(cls, name, None) is None or getattr(cls, name).__module__ == __name__
+                for name in HANDLER_METHODS
+            )
+        return uses_fast
+
+    def start_feed(self, handler):
+        """
+        Write everything that precedes the first item: the document header,
+        the root element and its children. Together with write_item() and
+        end_feed() this allows a feed to be written incrementally.
+        """
+        raise NotImplementedError(
+            "subclasses of SyndicationFeed must provide a start_feed() method"
+        )
+
+    def write_item(self, handler, item):
+        """
+        Write a single item (i.e. item/entry) element.
+        """
+        raise NotImplementedError(
+            "subclasses of SyndicationFeed must provide a write_item() method"
+        )
+
+    def end_feed(self, handler):
+        """
+        Write everything that follows the last item.
+        """
+        raise NotImplementedError("subclasses of SyndicationFeed must provide an end_feed() method")
+
+    def write_items(self, handler):
+        """
+        Write all items. With a fragment_cache, items serialized by an
+        earlier render are copied as is and only new or changed items are
+        serialized.
+        """
+        separator = self.item_separator
+        if self.fragment_cache is None:
+            for index, item in enumerate(self.items):
+                if separator and index:
+                    handler.ignorableWhitespace(separator)
+                self.write_item(handler, item)
+            return
+        fragments = FragmentWriter(self)
+        for index, item in enumerate(self.items):
+            if separator and index:
+                handler.ignorableWhitespace(separator)
+            handler.ignorableWhitespace(fragments.get(item))
+
+    def fragment_key(self, item):
+        """
+        Return the key the serialized item is cached under, or None if it
+        cannot be cached: an item is identified by its guid and is considered
+        unchanged as long as its version, or else its updateddate or pubdate,
+        is the same.
+        """
+        version = item.version
+        if version is None:
+            version = item.updateddate or item.pubdate
+        if item.unique_id is None or version is None:
+            return None
+        return (type(self), self.fragment_namespace, item.unique_id, version)
+
+    def copy_as(self, feed_class):
+        """
+        Return a feed of another class (format) with the same attributes,
+        sharing the items of this one.
+        """
+        feed = feed_class.__new__(feed_class)
+        feed.__dict__.update(self.__dict__)
+        feed.feed = dict(self.feed)
+        return feed
+
+    def __getstate__(self):
+        # The fragment cache stays in the process the feed was built in
+        state = self.__dict__.copy()
+        state.pop("fragment_cache", None)
+        return state
+
     def writeString(self, encoding):
         """
         Return the feed in the given encoding as a string.
@@ -171,23 +328,232 @@ class SyndicationFeed:
         Return the latest item's pubdate or updateddate. If no items
         have either of these attributes this return the current UTC date/time.
         """
-        latest_date = None
-        date_keys = ("updateddate", "pubdate")
-
-        for item in self.items:
-            for date_key in date_keys:
-                item_date = item.get(date_key)
-                if item_date:
-                    if latest_date is None or item_date > latest_date:
-                        latest_date = item_date
+        # Dates are tracked as items are added; only items that were put into
+        # self.items directly need to be looked at.
+        latest_date = self._latest_date
+        for item in itertools.islice(self.items, self._dated_items, None):
+            latest_date = _latest_date(latest_date, item)
+        self._latest_date = latest_date
+        self._dated_items = len(self.items)
 
         # datetime.now(tz=utc) is slower, as documented in django.utils.timezone.now
         return latest_date or datetime.datetime.utcnow().replace(tzinfo=utc)
 
+    def updated_date(self):
+        """
+        Return the feed's explicit updateddate if one was given, otherwise
+        the latest item's date. Used for lastBuildDate/updated elements.
+        """
+        return self.feed.get("updateddate") or self.latest_post_date()
+
+
+_fast_xml_writer_classes = {}
+
+
+def _latest_date(latest_date, item):
+    for item_date in (item.updateddate, item.pubdate):
+        if item_date:
+            if latest_date is None or item_date > latest_date:
+                latest_date = item_date
+    return latest_date
+
+
+class FeedStreamWriter:
+    """
+    Write a feed incrementally: the header, then items one by one, then the
+    footer. Every method returns the encoded bytes produced by that step, so
+    items can be serialized as they are produced without being kept in
+    feed.items.
+    """
+
+    def __init__(self, feed, encoding="utf-8"):
+        self.feed = feed
+        self._buffer = BytesIO()
+        self._handler = feed.get_xml_writer(self._buffer, encoding)
+        self._fragments = FragmentWriter(feed) if feed.fragment_cache is not None else None
+        self._item_count = 0
+
+    def start(self):
+        self.feed.start_feed(self._handler)
+        return self._drain()
+
+    def write_item(self, item):
+        if self._item_count and self.feed.item_separator:
+            self._handler.ignorableWhitespace(self.feed.item_separator)
+        self._item_count += 1
+        if self._fragments is None:
+            self.feed.write_item(self._handler, item)
+        else:
+            self._handler.ignorableWhitespace(self._fragments.get(item))
+        return self._drain()
+
+    def end(self):
+        self.feed.end_feed(self._handler)
+        return self._drain()
+
+    def _drain(self):
+        if isinstance(self._handler, XMLWriter):
+            self._handler.flush()
+        data = self._buffer.getvalue()
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        return data
+
+
+class FragmentWriter:
+    """
+    Serialize items of a feed on their own, going through the feed's
+    fragment_cache.
+    """
+
+    def __init__(self, feed):
+        self.feed = feed
+        self.cache = feed.fragment_cache
+        self._buffer = StringIO()
+        self._handler = feed.get_xml_writer(self._buffer, "utf-8")
+
+    def get(self, item):
+        """Return the serialized item"""
+        key = self.feed.fragment_key(item)
+        if key is not None:
+            fragment = self.cache.get(key)
+            if fragment is not None:
+                return fragment
+        self.feed.write_item(self._handler, item)
+        if isinstance(self._handler, XMLWriter):
+            self._handler.flush()
+        fragment = self._buffer.getvalue()
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        if key is not None:
+            self.cache.set(key, fragment)
+        return fragment
+
+
+class FeedItem:
+    """
+    A feed item, as built by SyndicationFeed.make_item(). Extra keyword
+    arguments given to add_item() are kept in the `extra` mapping.
+
+    For compatibility with custom add_item_elements() implementations, items
+    can also be read and updated like dictionaries: item["title"],
+    item.get("foo").
+    """
+
+    __slots__ = (
+        "title",
+        "link",
+        "description",
+        "author_email",
+        "author_name",
+        "author_link",
+        "pubdate",
+        "updateddate",
+        "comments",
+        "unique_id",
+        "unique_id_is_permalink",
+        "enclosures",
+        "categories",
+        "item_copyright",
+        "ttl",
+        "version",
+        "extra",
+    )
+    fields = __slots__[:-1]
+
+    def __init__(
+        self,
+        title,
+        link,
+        description,
+        author_email=None,
+        author_name=None,
+        author_link=None,
+        pubdate=None,
+        updateddate=None,
+        comments=None,
+        unique_id=None,
+        unique_id_is_permalink=None,
+        enclosures=(),
+        categories=(),
+        item_copyright=None,
+        ttl=None,
+        version=None,
+        extra=None,
+    ):
+        self.title = title
+        self.link = link
+        self.description = description
+        self.author_email = author_email
+        self.author_name = author_name
+        self.author_link = author_link
+        self.pubdate = pubdate
+        self.updateddate = updateddate
+        self.comments = comments
+        self.unique_id = unique_id
+        self.unique_id_is_permalink = unique_id_is_permalink
+        self.enclosures = enclosures
+        self.categories = categories
+        self.item_copyright = item_copyright
+        self.ttl = ttl
+        self.version = version
+        self.extra = extra
+
+    def __getitem__(self, key):
+        if key in _ITEM_FIELDS:
+            return getattr(self, key)
+        if self.extra is not None and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key in _ITEM_FIELDS:
+            setattr(self, key, value)
+        elif self.extra is None:
+            self.extra = {key: value}
+        else:
+            self.extra[key] = value
+
+    def __contains__(self, key):
+        return key in _ITEM_FIELDS or (self.extra is not None and key in self.extra)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.fields) + len(self.extra or ())
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        if self.extra is None:
+            return list(self.fields)
+        return list(self.fields) + list(self.extra)
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+    def __repr__(self):
+        return "<%s %r>" % (type(self).__name__, self.title)
+
+    def __reduce__(self):
+        # Pickle as a plain tuple of values rather than a dict of slots, to
+        # keep feeds sent to another process for serialization compact
+        return (type(self), tuple(getattr(self, name) for name in self.__slots__))
+
+
+_ITEM_FIELDS = frozenset(FeedItem.fields)
+
 
 class Enclosure:
     """An RSS enclosure"""
 
+    __slots__ = ("url", "length", "mime_type")
+
     def __init__(self, url, length, mime_type):
         "All args are expected to be strings"
         self.length, self.mime_type = length, mime_type
@@ -196,25 +562,35 @@ class Enclosure:
 
 class RssFeed(SyndicationFeed):
     content_type = "application/rss+xml; charset=utf-8"
+    format_name = "rss"
 
     def write(self, outfile, encoding="utf-8"):
-        handler = SimplerXMLGenerator(outfile, encoding)
+        handler = self.get_xml_writer(outfile, encoding)
+        self.start_feed(handler)
+        self.write_items(handler)
+        self.end_feed(handler)
+        handler.endDocument()
+
+    def start_feed(self, handler):
         handler.startDocument()
         handler.startElement("rss", self.rss_attributes())
         handler.startElement("channel", self.root_attributes())
         self.add_root_elements(handler)
-        self.write_items(handler)
+
+    def end_feed(self, handler):
         self.endChannelElement(handler)
         handler.endElement("rss")
 
     def rss_attributes(self):
-        return {"version": self._version, "xmlns:atom": "http://www.w3.org/2005/Atom"}
+        attrs = {"version": self._version, "xmlns:atom": "http://www.w3.org/2005/Atom"}
+        if self.feed.get("archive"):
+            attrs["xmlns:fh"] = HISTORY_NS
+        return attrs
 
-    def write_items(self, handler):
-        for item in self.items:
-            handler.startElement("item", self.item_attributes(item))
-            self.add_item_elements(handler, item)
-            handler.endElement("item")
+    def write_item(self, handler, item):
+        handler.startElement("item", self.item_attributes(item))
+        self.add_item_elements(handler, item)
+        handler.endElement("item")
 
     def add_root_elements(self, handler):
         handler.addQuickElement("title", self.feed["title"])
@@ -224,13 +600,19 @@ class RssFeed(SyndicationFeed):
             handler.addQuickElement(
                 "atom:link", None, {"rel": "self", "href": self.feed["feed_url"]}
             )
+        for hub in self.feed.get("hubs", ()):
+            handler.addQuickElement("atom:link", None, {"rel": "hub", "href": hub})
+        for rel, href in self.feed.get("links", {}).items():
+            handler.addQuickElement("atom:link", None, {"rel": rel, "href": href})
+        if self.feed.get("archive"):
+            handler.addQuickElement("fh:archive", None)
         if self.feed["language"] is not None:
             handler.addQuickElement("language", self.feed["language"])
         for cat in self.feed["categories"]:
             handler.addQuickElement("category", cat)
         if self.feed["feed_copyright"] is not None:
             handler.addQuickElement("copyright", self.feed["feed_copyright"])
-        handler.addQuickElement("lastBuildDate", rfc2822_date(self.latest_post_date()))
+        handler.addQuickElement("lastBuildDate", rfc2822_date(self.updated_date()))
         if self.feed["ttl"] is not None:
             handler.addQuickElement("ttl", self.feed["ttl"])
 
@@ -242,10 +624,10 @@ class RssUserland091Feed(RssFeed):
     _version = "0.91"
 
     def add_item_elements(self, handler, item):
-        handler.addQuickElement("title", item["title"])
-        handler.addQuickElement("link", item["link"])
-        if item["description"] is not None:
-            handler.addQuickElement("description", item["description"])
+        handler.addQuickElement("title", item.title)
+        handler.addQuickElement("link", item.link)
+        if item.description is not None:
+            handler.addQuickElement("description", item.description)
 
 
 class Rss201rev2Feed(RssFeed):
@@ -253,38 +635,36 @@ class Rss201rev2Feed(RssFeed):
     _version = "2.0"
 
     def add_item_elements(self, handler, item):
-        handler.addQuickElement("title", item["title"])
-        handler.addQuickElement("link", item["link"])
-        if item["description"] is not None:
-            handler.addQuickElement("description", item["description"])
+        handler.addQuickElement("title", item.title)
+        handler.addQuickElement("link", item.link)
+        if item.description is not None:
+            handler.addQuickElement("description", item.description)
 
         # Author information.
-        if item["author_name"] and item["author_email"]:
+        if item.author_name and item.author_email:
+            handler.addQuickElement("author", "%s (%s)" % (item.author_email, item.author_name))
+        elif item.author_email:
+            handler.addQuickElement("author", item.author_email)
+        elif item.author_name:
             handler.addQuickElement(
-                "author", "%s (%s)" % (item["author_email"], item["author_name"])
-            )
-        elif item["author_email"]:
-            handler.addQuickElement("author", item["author_email"])
-        elif item["author_name"]:
-            handler.addQuickElement(
-                "dc:creator", item["author_name"], {"xmlns:dc": "http://purl.org/dc/elements/1.1/"},
+                "dc:creator", item.author_name, {"xmlns:dc": "http://purl.org/dc/elements/1.1/"},
             )
 
-        if item["pubdate"] is not None:
-            handler.addQuickElement("pubDate", rfc2822_date(item["pubdate"]))
-        if item["comments"] is not None:
-            handler.addQuickElement("comments", item["comments"])
-        if item["unique_id"] is not None:
+        if item.pubdate is not None:
+            handler.addQuickElement("pubDate", rfc2822_date(item.pubdate))
+        if item.comments is not None:
+            handler.addQuickElement("comments", item.comments)
+        if item.unique_id is not None:
             guid_attrs = {}
-            if isinstance(item.get("unique_id_is_permalink"), bool):
-                guid_attrs["isPermaLink"] = str(item["unique_id_is_permalink"]).lower()
-            handler.addQuickElement("guid", item["unique_id"], guid_attrs)
-        if item["ttl"] is not None:
-            handler.addQuickElement("ttl", item["ttl"])
+            if isinstance(item.unique_id_is_permalink, bool):
+                guid_attrs["isPermaLink"] = str(item.unique_id_is_permalink).lower()
+            handler.addQuickElement("guid", item.unique_id, guid_attrs)
+        if item.ttl is not None:
+            handler.addQuickElement("ttl", item.ttl)
 
         # Enclosure.
-        if item["enclosures"]:
-            enclosures = list(item["enclosures"])
+        if item.enclosures:
+            enclosures = list(item.enclosures)
             if len(enclosures) > 1:
                 raise ValueError(
                     "RSS feed items may only have one enclosure, see "
@@ -298,36 +678,53 @@ class Rss201rev2Feed(RssFeed):
             )
 
         # Categories.
-        for cat in item["categories"]:
+        for cat in item.categories:
             handler.addQuickElement("category", cat)
 
 
 class Atom1Feed(SyndicationFeed):
     # Spec: https://tools.ietf.org/html/rfc4287
     content_type = "application/atom+xml; charset=utf-8"
+    format_name = "atom"
     ns = "http://www.w3.org/2005/Atom"
 
     def write(self, outfile, encoding):
-        handler = SimplerXMLGenerator(outfile, encoding)
+        handler = self.get_xml_writer(outfile, encoding)
+        self.start_feed(handler)
+        self.write_items(handler)
+        self.end_feed(handler)
+        handler.endDocument()
+
+    def start_feed(self, handler):
         handler.startDocument()
         handler.startElement("feed", self.root_attributes())
         self.add_root_elements(handler)
-        self.write_items(handler)
+
+    def end_feed(self, handler):
         handler.endElement("feed")
 
     def root_attributes(self):
         if self.feed["language"] is not None:
-            return {"xmlns": self.ns, "xml:lang": self.feed["language"]}
+            attrs = {"xmlns": self.ns, "xml:lang": self.feed["language"]}
         else:
-            return {"xmlns": self.ns}
+            attrs = {"xmlns": self.ns}
+        if self.feed.get("archive"):
+            attrs["xmlns:fh"] = HISTORY_NS
+        return attrs
 
     def add_root_elements(self, handler):
         handler.addQuickElement("title", self.feed["title"])
         handler.addQuickElement("link", "", {"rel": "alternate", "href": self.feed["link"]})
         if self.feed["feed_url"] is not None:
             handler.addQuickElement("link", "", {"rel": "self", "href": self.feed["feed_url"]})
+        for hub in self.feed.get("hubs", ()):
+            handler.addQuickElement("link", "", {"rel": "hub", "href": hub})
+        for rel, href in self.feed.get("links", {}).items():
+            handler.addQuickElement("link", "", {"rel": rel, "href": href})
+        if self.feed.get("archive"):
+            handler.addQuickElement("fh:archive", None)
         handler.addQuickElement("id", self.feed["id"])
-        handler.addQuickElement("updated", rfc3339_date(self.latest_post_date()))
+        handler.addQuickElement("updated", rfc3339_date(self.updated_date()))
         if self.feed["author_name"] is not None:
             handler.startElement("author", {})
             handler.addQuickElement("name", self.feed["author_name"])
@@ -343,45 +740,44 @@ class Atom1Feed(SyndicationFeed):
         if self.feed["feed_copyright"] is not None:
             handler.addQuickElement("rights", self.feed["feed_copyright"])
 
-    def write_items(self, handler):
-        for item in self.items:
-            handler.startElement("entry", self.item_attributes(item))
-            self.add_item_elements(handler, item)
-            handler.endElement("entry")
+    def write_item(self, handler, item):
+        handler.startElement("entry", self.item_attributes(item))
+        self.add_item_elements(handler, item)
+        handler.endElement("entry")
 
     def add_item_elements(self, handler, item):
-        handler.addQuickElement("title", item["title"])
-        handler.addQuickElement("link", "", {"href": item["link"], "rel": "alternate"})
+        handler.addQuickElement("title", item.title)
+        handler.addQuickElement("link", "", {"href": item.link, "rel": "alternate"})
 
-        if item["pubdate"] is not None:
-            handler.addQuickElement("published", rfc3339_date(item["pubdate"]))
+        if item.pubdate is not None:
+            handler.addQuickElement("published", rfc3339_date(item.pubdate))
 
-        if item["updateddate"] is not None:
-            handler.addQuickElement("updated", rfc3339_date(item["updateddate"]))
+        if item.updateddate is not None:
+            handler.addQuickElement("updated", rfc3339_date(item.updateddate))
 
         # Author information.
-        if item["author_name"] is not None:
+        if item.author_name is not None:
             handler.startElement("author", {})
-            handler.addQuickElement("name", item["author_name"])
-            if item["author_email"] is not None:
-                handler.addQuickElement("email", item["author_email"])
-            if item["author_link"] is not None:
-                handler.addQuickElement("uri", item["author_link"])
+            handler.addQuickElement("name", item.author_name)
+            if item.author_email is not None:
+                handler.addQuickElement("email", item.author_email)
+            if item.author_link is not None:
+                handler.addQuickElement("uri", item.author_link)
             handler.endElement("author")
 
         # Unique ID.
-        if item["unique_id"] is not None:
-            unique_id = item["unique_id"]
+        if item.unique_id is not None:
+            unique_id = item.unique_id
         else:
-            unique_id = get_tag_uri(item["link"], item["pubdate"])
+            unique_id = get_tag_uri(item.link, item.pubdate)
         handler.addQuickElement("id", unique_id)
 
         # Summary.
-        if item["description"] is not None:
-            handler.addQuickElement("summary", item["description"], {"type": "html"})
+        if item.description is not None:
+            handler.addQuickElement("summary", item.description, {"type": "html"})
 
         # Enclosures.
-        for enclosure in item["enclosures"]:
+        for enclosure in item.enclosures:
             handler.addQuickElement(
                 "link",
                 "",
@@ -394,12 +790,104 @@ class Atom1Feed(SyndicationFeed):
             )
 
         # Categories.
-        for cat in item["categories"]:
+        for cat in item.categories:
             handler.addQuickElement("category", "", {"term": cat})
 
         # Rights.
-        if item["item_copyright"] is not None:
-            handler.addQuickElement("rights", item["item_copyright"])
+        if item.item_copyright is not None:
+            handler.addQuickElement("rights", item.item_copyright)
+
+
+class JsonFeed(SyndicationFeed):
+    # Spec: https://www.jsonfeed.org/version/1.1/
+    content_type = "application/feed+json; charset=utf-8"
+    format_name = "json"
+    item_separator = ","
+    version = "https://jsonfeed.org/version/1.1"
+
+    # The document is written as raw text through the same handler API as
+    # XML feeds, so that streaming and fragment caching work alike.
+
+    def write(self, outfile, encoding="utf-8"):
+        handler = self.get_xml_writer(outfile, encoding)
+        self.start_feed(handler)
+        self.write_items(handler)
+        self.end_feed(handler)
+        handler.endDocument()
+
+    def start_feed(self, handler):
+        root = json_dumps(self.root_object())
+        handler.ignorableWhitespace(root[:-1] + ',"items":[')
+
+    def end_feed(self, handler):
+        handler.ignorableWhitespace("]}")
+
+    def write_item(self, handler, item):
+        handler.ignorableWhitespace(json_dumps(self.item_object(item)))
+
+    def root_object(self):
+        """
+        Return the top-level object of the feed, without items. Override to
+        add fields, e.g. icon.
+        """
+        root = {"version": self.version, "title": self.feed["title"]}
+        if self.feed["link"] is not None:
+            root["home_page_url"] = self.feed["link"]
+        if self.feed["feed_url"] is not None:
+            root["feed_url"] = self.feed["feed_url"]
+        next_url = self.feed.get("links", {}).get("next")
+        if next_url is not None:
+            root["next_url"] = next_url
+        description = self.feed["description"] or self.feed["subtitle"]
+        if description is not None:
+            root["description"] = description
+        if self.feed["author_name"] is not None:
+            root["authors"] = [_json_author(self.feed["author_name"], self.feed["author_link"])]
+        if self.feed["language"] is not None:
+            root["language"] = self.feed["language"]
+        hubs = self.feed.get("hubs")
+        if hubs:
+            root["hubs"] = [{"type": "WebSub", "url": hub} for hub in hubs]
+        return root
+
+    def item_object(self, item):
+        """
+        Return the object of an item. Override to add fields, e.g. image.
+        """
+        obj = {"id": item.unique_id if item.unique_id is not None else item.link}
+        if item.link is not None:
+            obj["url"] = item.link
+        if item.title is not None:
+            obj["title"] = item.title
+        if item.description is not None:
+            obj["content_html"] = item.description
+        if item.pubdate is not None:
+            obj["date_published"] = rfc3339_date(item.pubdate)
+        if item.updateddate is not None:
+            obj["date_modified"] = rfc3339_date(item.updateddate)
+        if item.author_name is not None:
+            obj["authors"] = [_json_author(item.author_name, item.author_link)]
+        if item.categories:
+            obj["tags"] = list(item.categories)
+        if item.enclosures:
+            obj["attachments"] = [_json_attachment(enclosure) for enclosure in item.enclosures]
+        return obj
+
+
+def _json_author(name, url):
+    author = {"name": name}
+    if url is not None:
+        author["url"] = url
+    return author
+
+
+def _json_attachment(enclosure):
+    attachment = {"url": enclosure.url, "mime_type": enclosure.mime_type}
+    try:
+        attachment["size_in_bytes"] = int(enclosure.length)
+    except (TypeError, ValueError):
+        pass
+    return attachment
 
 
 # This isolates the decision of what the system default is, so calling code can
@@ -0,0 +1,78 @@
+"""
+Application lifespan support for the background services of the package
+(FeedRefreshScheduler, WebSubPublisher, WebSubHub), and for running several
+of them, or an application's own lifespan, in a single Starlette app.
+"""
+from typing import Any, Callable, Dict, List, Optional
+
+Lifespan = Callable[[Any], Any]
+
+
+class LifespanMixin:
+    """
+    Follow the application lifespan: with Starlette(lifespan=obj.lifespan),
+    startup() is awaited on startup and shutdown() on shutdown.
+    """
+
+    async def startup(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    def lifespan(self, app: Any) -> "LifespanMixin":
+        return self
+
+    async def __aenter__(self) -> None:
+        # Nothing is yielded: Starlette would take it for the lifespan state
+        await self.startup()
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.shutdown()
+
+
+def combine_lifespans(*lifespans: Lifespan) -> Lifespan:
+    """
+    Combine lifespans into one: they are entered in order on startup and
+    exited in reverse order on shutdown. The state they yield, if any, is
+    merged.
+
+    >>> lifespan = combine_lifespans(hub.lifespan, publisher.lifespan, scheduler.lifespan)
+    >>> app = Starlette(routes=routes, lifespan=lifespan)
+    """
+
+    def lifespan(app: Any) -> "_CombinedLifespan":
+        return _CombinedLifespan([lifespan(app) for lifespan in lifespans])
+
+    return lifespan
+
+
+class _CombinedLifespan:
+    def __init__(self, contexts: List[Any]) -> None:
+        self.contexts = contexts
+        self._entered: List[Any] = []
+
+    async def __aenter__(self) -> Optional[Dict[str, Any]]:
+        state: Dict[str, Any] = {}
+        for context in self.contexts:
+            try:
+                value = await context.__aenter__()
+            except BaseException as exc:
+                # Shut down what was started before failing
+                await self.__aexit__(type(exc), exc, exc.__traceback__)
+                raise
+            self._entered.append(context)
+            if value is not None:
+                state.update(value)
+        return state or None
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        error: Optional[BaseException] = None
+        while self._entered:
+            try:
+                await self._entered.pop().__aexit__(*exc_info)
+            except BaseException as exc:
+                # Every context is exited, the first error is raised after
+                error = error or exc
+        if error is not None:
+            raise error
@@ -0,0 +1,293 @@
+"""
+Timing of the stages of feed requests, see FeedEndpoint.metrics and
+FeedEndpoint.server_timing.
+
+Each request is recorded as a FeedTimings, passed to a MetricsSink once the
+response is complete: InMemorySink keeps them (e.g. for tests),
+PrometheusSink aggregates them for a Prometheus scrape route, and
+OpenTelemetrySink reports them as spans.
+"""
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Sequence, Tuple
+
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.routing import Route
+
+try:
+    from opentelemetry import trace as otel_trace
+except ImportError:
+    otel_trace = None
+
+
+class Stage:
+    __slots__ = ("name", "offset", "seconds")
+
+    def __init__(self, name: str, offset: float, seconds: float) -> None:
+        self.name = name
+        # Seconds since the start of the request
+        self.offset = offset
+        self.seconds = seconds
+
+
+class FeedTimings:
+    """
+    Durations of the stages of a feed request, along with the number of
+    items and bytes of the response. Stages may repeat, e.g. "serialize"
+    once per format.
+    """
+
+    __slots__ = (
+        "endpoint",
+        "path",
+        "status",
+        "start_time",
+        "started",
+        "seconds",
+        "stages",
+        "item_count",
+        "bytes",
+    )
+
+    def __init__(self, endpoint: str, path: str) -> None:
+        self.endpoint = endpoint
+        self.path = path
+        self.status = 200
+        # Wall clock time of the start of the request, and the
+        # perf_counter() time stages are measured from
+        self.start_time = time.time()
+        self.started = time.perf_counter()
+        self.seconds = 0.0
+        self.stages: List[Stage] = []
+        self.item_count: Optional[int] = None
+        self.bytes: Optional[int] = None
+
+    def stage(self, name: str) -> "_StageTimer":
+        """Return a context manager timing the stage"""
+        return _StageTimer(self, name)
+
+    def add_stage(self, name: str, started: float, seconds: float) -> None:
+        """Record a stage started at the given perf_counter() time"""
+        self.stages.append(Stage(name, started - self.started, seconds))
+
+    def finish(self) -> None:
+        self.seconds = time.perf_counter() - self.started
+
+    def server_timing(self) -> str:
+        """Return the value of a Server-Timing header with the stages so far"""
+        return ", ".join(
+            "%s;dur=%.3f" % (stage.name, stage.seconds * 1000) for stage in self.stages
+        )
+
+
+class _StageTimer:
+    __slots__ = ("timings", "name", "started")
+
+    def __init__(self, timings: FeedTimings, name: str) -> None:
+        self.timings = timings
+        self.name = name
+
+    def __enter__(self) -> None:
+        self.started = time.perf_counter()
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.timings.add_stage(self.name, self.started, time.perf_counter() - self.started)
+
+
+class _NoTimer:
+    """Stand-in for _StageTimer when timing is disabled"""
+
+    __slots__ = ()
+
+    def __enter__(self) -> None:
+        pass
+
+    def __exit__(self, *exc_info: Any) -> None:
+        pass
+
+
+NO_TIMER = _NoTimer()
+
+
+class MetricsSink(ABC):
+    """Receives the timings of every request to the endpoints it is set on"""
+
+    @abstractmethod
+    def record(self, timings: FeedTimings) -> None:
+        """Called once the response is complete. Must not block."""
+
+
+class InMemorySink(MetricsSink):
+    """Keep the timings of the `max_records` latest requests"""
+
+    def __init__(self, max_records: int = 1000) -> None:
+        self.records: Deque[FeedTimings] = deque(maxlen=max_records)
+
+    def record(self, timings: FeedTimings) -> None:
+        self.records.append(timings)
+
+    def clear(self) -> None:
+        self.records.clear()
+
+
+# Upper bounds of the histogram buckets of stage durations, in seconds
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class _Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self, bucket_count: int) -> None:
+        self.counts = [0] * bucket_count
+        self.sum = 0.0
+        self.count = 0
+
+
+class PrometheusSink(MetricsSink):
+    """
+    Aggregate timings into Prometheus metrics, exported in the text format
+    by the route returned by route():
+
+    - feedgen_requests_total{endpoint, status}
+    - feedgen_request_seconds and feedgen_stage_seconds{stage} histograms
+    - feedgen_items_total and feedgen_response_bytes_total
+
+    all labelled with the endpoint class name.
+    """
+
+    content_type = "text/plain; version=0.0.4; charset=utf-8"
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS, prefix: str = "feedgen") -> None:
+        self.buckets = tuple(sorted(buckets))
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._requests: Dict[Tuple[str, int], int] = {}
+        self._request_seconds: Dict[str, _Histogram] = {}
+        self._stage_seconds: Dict[Tuple[str, str], _Histogram] = {}
+        self._items: Dict[str, int] = {}
+        self._bytes: Dict[str, int] = {}
+
+    def record(self, timings: FeedTimings) -> None:
+        endpoint = timings.endpoint
+        with self._lock:
+            key = (endpoint, timings.status)
+            self._requests[key] = self._requests.get(key, 0) + 1
+            self._observe(self._request_seconds, endpoint, timings.seconds)
+            for stage in timings.stages:
+                self._observe(self._stage_seconds, (endpoint, stage.name), stage.seconds)
+            if timings.item_count is not None:
+                self._items[endpoint] = self._items.get(endpoint, 0) + timings.item_count
+            if timings.bytes is not None:
+                self._bytes[endpoint] = self._bytes.get(endpoint, 0) + timings.bytes
+
+    def _observe(self, histograms: Dict[Any, _Histogram], key: Any, seconds: float) -> None:
+        histogram = histograms.get(key)
+        if histogram is None:
+            histogram = histograms[key] = _Histogram(len(self.buckets))
+        for index, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                histogram.counts[index] += 1
+                break
+        histogram.sum += seconds
+        histogram.count += 1
+
+    def render(self) -> str:
+        """Return the metrics in the Prometheus text exposition format"""
+        prefix = self.prefix
+        lines = []
+        with self._lock:
+            lines.append("# TYPE %s_requests_total counter" % prefix)
+            for (endpoint, status), count in sorted(self._requests.items()):
+                labels = _labels(endpoint=endpoint, status=str(status))
+                lines.append("%s_requests_total{%s} %d" % (prefix, labels, count))
+            lines.append("# TYPE %s_request_seconds histogram" % prefix)
+            for endpoint, histogram in sorted(self._request_seconds.items()):
+                self._render_histogram(
+                    lines, "%s_request_seconds" % prefix, {"endpoint": endpoint}, histogram
+                )
+            lines.append("# TYPE %s_stage_seconds histogram" % prefix)
+            for (endpoint, stage), histogram in sorted(self._stage_seconds.items()):
+                self._render_histogram(
+                    lines,
+                    "%s_stage_seconds" % prefix,
+                    {"endpoint": endpoint, "stage": stage},
+                    histogram,
+                )
+            for name, values in (("items", self._items), ("response_bytes", self._bytes)):
+                lines.append("# TYPE %s_%s_total counter" % (prefix, name))
+                for endpoint, value in sorted(values.items()):
+                    lines.append(
+                        "%s_%s_total{%s} %d" % (prefix, name, _labels(endpoint=endpoint), value)
+                    )
+        return "\n".join(lines) + "\n"
+
+    def _render_histogram(
+        self, lines: List[str], name: str, labels: Dict[str, str], histogram: _Histogram
+    ) -> None:
+        cumulative = 0
+        for bound, count in zip(self.buckets, histogram.counts):
+            cumulative += count
+            lines.append(
+                "%s_bucket{%s} %d" % (name, _labels(**labels, le=_format_float(bound)), cumulative)
+            )
+        lines.append("%s_bucket{%s} %d" % (name, _labels(**labels, le="+Inf"), histogram.count))
+        lines.append("%s_sum{%s} %s" % (name, _labels(**labels), _format_float(histogram.sum)))
+        lines.append("%s_count{%s} %d" % (name, _labels(**labels), histogram.count))
+
+    async def endpoint(self, request: Request) -> Response:
+        return Response(self.render(), media_type=self.content_type)
+
+    def route(self, path: str = "/metrics") -> Route:
+        return Route(path, self.endpoint, methods=["GET"])
+
+
+def _labels(**labels: str) -> str:
+    return ",".join('%s="%s"' % (name, _escape_label(value)) for name, value in labels.items())
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_float(value: float) -> str:
+    return repr(float(value))
+
+
+class OpenTelemetrySink(MetricsSink):
+    """
+    Report each request as a span, with a child span per stage, through an
+    OpenTelemetry tracer (by default the one of opentelemetry-api's global
+    tracer provider). Spans are created once the response is complete,
+    with their actual start and end times.
+    """
+
+    def __init__(self, tracer: Any = None) -> None:
+        if tracer is None:
+            if otel_trace is None:
+                raise RuntimeError("opentelemetry-api is required for OpenTelemetrySink")
+            tracer = otel_trace.get_tracer(__name__)
+        self.tracer = tracer
+
+    def record(self, timings: FeedTimings) -> None:
+        start = int(timings.start_time * 1e9)
+        attributes: Dict[str, Any] = {
+            "feed.endpoint": timings.endpoint,
+            "http.target": timings.path,
+            "http.status_code": timings.status,
+        }
+        if timings.item_count is not None:
+            attributes["feed.item_count"] = timings.item_count
+        if timings.bytes is not None:
+            attributes["feed.bytes"] = timings.bytes
+        span = self.tracer.start_span(
+            "feed %s" % timings.endpoint, start_time=start, attributes=attributes
+        )
+        context = otel_trace.set_span_in_context(span) if otel_trace is not None else None
+        for stage in timings.stages:
+            stage_start = start + int(stage.offset * 1e9)
+            child = self.tracer.start_span(stage.name, context=context, start_time=stage_start)
+            child.end(end_time=stage_start + int(stage.seconds * 1e9))
+        span.end(end_time=start + int(timings.seconds * 1e9))
@@ -0,0 +1,73 @@
+"""
+Keyset cursors for paged and archived feeds (RFC 5005).
+
+Items are expected newest first, ordered by publication date and then guid.
+A cursor is the (pubdate, guid) of the last item of a page; the next page
+holds the items that sort after it. Cursors are sent to clients as opaque
+base64url-encoded JSON.
+"""
+import base64
+import binascii
+import datetime
+import json
+from typing import Any, NamedTuple, Optional, Tuple
+
+from .utils import epoch_microseconds
+
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+# Namespace of the fh:archive element marking archive documents
+HISTORY_NS = "http://purl.org/syndication/history/1.0"
+
+MAX_CURSOR_LENGTH = 512
+
+
+class Cursor(NamedTuple):
+    pubdate: datetime.datetime
+    guid: str
+
+    def key(self) -> Tuple[int, str]:
+        return (epoch_microseconds(self.pubdate), self.guid)
+
+
+def item_cursor(item_kwargs: Any) -> Optional[Cursor]:
+    """
+    Return the cursor pointing at an item, given its add_item keyword
+    arguments, or None if it has no publication date or guid.
+    """
+    pubdate = item_kwargs.get("pubdate")
+    guid = item_kwargs.get("unique_id")
+    if pubdate is None or guid is None:
+        return None
+    return Cursor(pubdate, str(guid))
+
+
+def follows(item_kwargs: Any, cursor: Cursor) -> bool:
+    """Whether the item comes after the cursor, i.e. on a later page"""
+    item = item_cursor(item_kwargs)
+    return item is not None and item.key() < cursor.key()
+
+
+def encode_cursor(cursor: Cursor) -> str:
+    data = json.dumps([epoch_microseconds(cursor.pubdate), cursor.guid], separators=(",", ":"))
+    return base64.urlsafe_b64encode(data.encode("utf-8")).rstrip(b"=").decode("ascii")
+
+
+def decode_cursor(value: str) -> Cursor:
+    """
+    Parse a cursor sent by a client. Raise ValueError if it is not valid.
+    """
+    if len(value) > MAX_CURSOR_LENGTH:
+        raise ValueError("Cursor too long")
+    try:
+        data = base64.urlsafe_b64decode(value + "=" * (-len(value) % 4))
+        microseconds, guid = json.loads(data.decode("utf-8"))
+    except (binascii.Error, UnicodeError, ValueError, TypeError):
+        raise ValueError("Malformed cursor")
+    if type(microseconds) is not int or not isinstance(guid, str):
+        raise ValueError("Malformed cursor")
+    try:
+        pubdate = EPOCH + datetime.timedelta(microseconds=microseconds)
+    except OverflowError:
+        raise ValueError("Malformed cursor")
+    return Cursor(pubdate, guid)
@@ -0,0 +1,116 @@
+"""
+Background re-rendering of frequently requested feeds, so that they are
+always served from the cache and never rendered on the request path.
+"""
+import asyncio
+import logging
+import random
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Type
+
+from .lifespan import LifespanMixin
+
+if TYPE_CHECKING:
+    from .feed import FeedEndpoint
+
+logger = logging.getLogger(__name__)
+
+
+class ScheduledFeed:
+    __slots__ = ("endpoint", "path", "query", "secure", "path_params", "interval")
+
+    def __init__(
+        self,
+        endpoint: Type["FeedEndpoint"],
+        path: str,
+        query: str = "",
+        secure: bool = True,
+        path_params: Optional[Dict[str, Any]] = None,
+        interval: Optional[float] = None,
+    ) -> None:
+        self.endpoint = endpoint
+        self.path = path
+        self.query = query
+        self.secure = secure
+        self.path_params = path_params
+        self.interval = interval
+
+
+class FeedRefreshScheduler(LifespanMixin):
+    """
+    Re-render registered feeds into their endpoint's cache every `interval`
+    seconds, randomly shifted by up to `jitter` (a fraction of the interval)
+    so that feeds do not all refresh at once. At most `max_concurrency` feeds
+    are rendered at the same time.
+
+    The scheduler follows the application lifespan:
+
+    >>> scheduler = FeedRefreshScheduler(interval=60)
+    >>> scheduler.register(Feed, "/feed")
+    >>> app = Starlette(routes=routes, lifespan=scheduler.lifespan)
+
+    or, with older Starlette versions,
+    Starlette(on_startup=[scheduler.start], on_shutdown=[scheduler.stop]).
+    """
+
+    def __init__(self, interval: float = 60, jitter: float = 0.1, max_concurrency: int = 4) -> None:
+        self.interval = interval
+        self.jitter = jitter
+        self.max_concurrency = max_concurrency
+        self.feeds: List[ScheduledFeed] = []
+        self._tasks: List["asyncio.Future[None]"] = []
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._running = False
+
+    @property
+    def running(self) -> bool:
+        return self._running
+
+    def register(
+        self,
+        endpoint: Type["FeedEndpoint"],
+        path: str,
+        query: str = "",
+        secure: bool = True,
+        path_params: Optional[Dict[str, Any]] = None,
+        interval: Optional[float] = None,
+    ) -> ScheduledFeed:
+        feed = ScheduledFeed(endpoint, path, query, secure, path_params, interval)
+        self.feeds.append(feed)
+        if self.running:
+            self._tasks.append(asyncio.ensure_future(self._run(feed)))
+        return feed
+
+    async def start(self) -> None:
+        if self.running:
+            return
+        self._running = True
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._tasks = [asyncio.ensure_future(self._run(feed)) for feed in self.feeds]
+
+    async def stop(self) -> None:
+        self._running = False
+        tasks, self._tasks = self._tasks, []
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def refresh(self, feed: ScheduledFeed) -> None:
+        """Render a single feed now, logging rather than raising errors"""
+        assert self._semaphore is not None, "The scheduler is not started"
+        async with self._semaphore:
+            try:
+                await feed.endpoint.refresh(feed.path, feed.query, feed.secure, feed.path_params)
+            except Exception:
+                logger.exception("Failed to refresh feed %s", feed.path)
+
+    async def _run(self, feed: ScheduledFeed) -> None:
+        interval = feed.interval if feed.interval is not None else self.interval
+        while True:
+            await self.refresh(feed)
+            await asyncio.sleep(interval * (1 + random.uniform(-self.jitter, self.jitter)))
+
+    async def startup(self) -> None:
+        await self.start()
+
+    async def shutdown(self) -> None:
+        await self.stop()
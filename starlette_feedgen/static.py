@@ -0,0 +1,63 @@
+"""
+Feeds pre-rendered to files, see FeedEndpoint.static_root and the render
+command (python -m starlette_feedgen render --help).
+"""
+import hashlib
+import os
+import tempfile
+import time
+from typing import Optional
+
+# File name suffixes of the compressed copies of a pre-rendered feed
+SUFFIXES = {"gzip": ".gz", "br": ".br", "zstd": ".zst"}
+
+
+def static_file_path(root: str, path: str, query: str = "", coding: Optional[str] = None) -> str:
+    """
+    Return the file a feed served at the given URL path and query string is
+    pre-rendered to: <root>/<path>/index, with a hash of the query appended
+    if any, and the suffix of the content coding for a compressed copy.
+    "." and ".." path segments are ignored, so the file is always under root.
+    """
+    segments = [segment for segment in path.split("/") if segment not in ("", ".", "..")]
+    name = "index"
+    if query:
+        name += "-" + hashlib.sha256(query.encode("utf-8")).hexdigest()[:16]
+    if coding is not None:
+        name += SUFFIXES[coding]
+    return os.path.join(root, *segments, name)
+
+
+def stat_fresh(path: str, max_age: Optional[float] = None) -> Optional[os.stat_result]:
+    """
+    Return the stat of the file if it exists and was written less than
+    `max_age` seconds ago (if given), else None.
+    """
+    try:
+        stat = os.stat(path)
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+    if max_age is not None and stat.st_mtime + max_age <= time.time():
+        return None
+    return stat
+
+
+def write_atomic(path: str, data: bytes) -> None:
+    """
+    Write the file through a temporary file renamed into place, so that it
+    is never served half-written.
+    """
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as tmp:
+            tmp.write(data)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
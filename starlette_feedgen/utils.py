@@ -1,20 +1,83 @@
+import codecs
 import datetime
 import email
+import io
+import json
 import re
 from asyncio.coroutines import iscoroutinefunction
-from email.utils import formatdate
-from typing import Any, Callable, Union
+from calendar import timegm
+from email.utils import formatdate, parsedate_to_datetime
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Mapping, Optional, Union
 from urllib.parse import quote, urlparse
-from xml.sax.saxutils import XMLGenerator
+from xml.sax.saxutils import XMLGenerator, escape, quoteattr
 
 from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Control characters are not supported in XML 1.0
+# See http://www.w3.org/International/questions/qa-controls
+CONTROL_CHARS = re.compile(r"[\x00-\x08\x0B-\x0C\x0E-\x1F]")
+# How text with control characters is written: "strict" raises
+# UnserializableContentError, "strip" removes them and "replace" replaces
+# them with U+FFFD.
+SANITIZE_POLICIES = ("strict", "strip", "replace")
+_CONTROL_CODEPOINTS = [c for c in range(0x20) if c not in (0x09, 0x0A, 0x0D)]
+_SANITIZE_TABLES = {
+    "strip": dict.fromkeys(_CONTROL_CODEPOINTS),
+    "replace": dict.fromkeys(_CONTROL_CODEPOINTS, "\ufffd"),
+}
+# Attribute values without these characters (or control characters) are
+# written as is
+ATTR_SPECIAL_CHARS = re.compile("[&<>\"'\n\r\t\x00-\x08\x0b-\x0c\x0e-\x1f]")
 
 
 class UnserializableContentError(ValueError):
     pass
 
 
+def sanitize_text(
+    content: str, policy: str = "strict", on_sanitize: Optional[Callable[[], None]] = None
+) -> str:
+    """
+    Return the text with control characters handled according to the
+    policy (see SANITIZE_POLICIES), calling on_sanitize if any was found.
+    Text without them is returned as is after a single regex search.
+    """
+    if not CONTROL_CHARS.search(content):
+        return content
+    if policy == "strict":
+        # Fail loudly when content has control chars (unsupported in XML 1.0)
+        raise UnserializableContentError("Control characters are not supported in XML 1.0")
+    if on_sanitize is not None:
+        on_sanitize()
+    return content.translate(_SANITIZE_TABLES[policy])
+
+
+def _check_policy(policy: str) -> str:
+    if policy not in SANITIZE_POLICIES:
+        raise ValueError("Unknown sanitize policy: %s" % policy)
+    return policy
+
+
 class SimplerXMLGenerator(XMLGenerator):
+    def __init__(
+        self,
+        out: Any = None,
+        encoding: str = "iso-8859-1",
+        short_empty_elements: bool = False,
+        sanitize: str = "strict",
+        on_sanitize: Optional[Callable[[], None]] = None,
+    ) -> None:
+        super().__init__(out, encoding, short_empty_elements)
+        self.sanitize = _check_policy(sanitize)
+        self.on_sanitize = on_sanitize
+
     def addQuickElement(self, name: str, contents: str = None, attrs: dict = None) -> None:
         """Convenience method for adding an element with no children"""
         if attrs is None:
@@ -24,14 +87,118 @@ class SimplerXMLGenerator(XMLGenerator):
             self.characters(contents)
         self.endElement(name)
 
+    def startElement(self, name: str, attrs: Mapping[str, str]) -> None:
+        if any(CONTROL_CHARS.search(value) for value in attrs.values()):
+            attrs = {
+                attname: sanitize_text(value, self.sanitize, self.on_sanitize)
+                for attname, value in attrs.items()
+            }
+        XMLGenerator.startElement(self, name, attrs)
+
     def characters(self, content: str) -> None:
-        if content and re.search(r"[\x00-\x08\x0B-\x0C\x0E-\x1F]", content):
-            # Fail loudly when content has control chars (unsupported in XML 1.0)
-            # See http://www.w3.org/International/questions/qa-controls
-            raise UnserializableContentError("Control characters are not supported in XML 1.0")
+        if content:
+            if not isinstance(content, str):
+                content = str(content, self._encoding)
+            content = sanitize_text(content, self.sanitize, self.on_sanitize)
         XMLGenerator.characters(self, content)
 
 
+class XMLWriter:
+    """
+    A faster replacement for SimplerXMLGenerator that produces exactly the
+    same output. It implements the subset of the SAX handler API used by
+    feed generators; start and end tags are built once per element name and
+    the document is accumulated as a list of strings, which is joined and
+    encoded in one go when it is flushed to `out`.
+    """
+
+    _start_tags: Dict[str, str] = {}
+    _end_tags: Dict[str, str] = {}
+
+    def __init__(
+        self,
+        out: Any = None,
+        encoding: str = "utf-8",
+        sanitize: str = "strict",
+        on_sanitize: Optional[Callable[[], None]] = None,
+    ) -> None:
+        self._out = out
+        self._encoding = encoding
+        self.sanitize = _check_policy(sanitize)
+        self.on_sanitize = on_sanitize
+        self._parts: List[str] = []
+        self._write = self._parts.append
+
+    def startDocument(self) -> None:
+        self._write('<?xml version="1.0" encoding="%s"?>\n' % self._encoding)
+
+    def endDocument(self) -> None:
+        self.flush()
+
+    def startElement(self, name: str, attrs: Optional[Mapping[str, str]]) -> None:
+        if attrs:
+            self._write("<%s%s>" % (name, self._format_attrs(attrs)))
+            return
+        tag = self._start_tags.get(name)
+        if tag is None:
+            tag = self._start_tags[name] = "<%s>" % name
+        self._write(tag)
+
+    def endElement(self, name: str) -> None:
+        tag = self._end_tags.get(name)
+        if tag is None:
+            tag = self._end_tags[name] = "</%s>" % name
+        self._write(tag)
+
+    def characters(self, content: str) -> None:
+        if content:
+            if not isinstance(content, str):
+                content = str(content, self._encoding)
+            if CONTROL_CHARS.search(content):
+                content = sanitize_text(content, self.sanitize, self.on_sanitize)
+            self._write(escape(content))
+
+    def ignorableWhitespace(self, content: str) -> None:
+        if content:
+            if not isinstance(content, str):
+                content = str(content, self._encoding)
+            self._write(content)
+
+    def _format_attrs(self, attrs: Mapping[str, str]) -> str:
+        parts = []
+        for name, value in attrs.items():
+            if ATTR_SPECIAL_CHARS.search(value):
+                if CONTROL_CHARS.search(value):
+                    value = sanitize_text(value, self.sanitize, self.on_sanitize)
+                parts.append(" %s=%s" % (name, quoteattr(value)))
+            else:
+                parts.append(' %s="%s"' % (name, value))
+        return "".join(parts)
+
+    def addQuickElement(self, name: str, contents: str = None, attrs: dict = None) -> None:
+        """Convenience method for adding an element with no children"""
+        self.startElement(name, attrs)
+        if contents is not None:
+            self.characters(contents)
+        self.endElement(name)
+
+    def getvalue(self) -> str:
+        """Return the document written since the last flush"""
+        return "".join(self._parts)
+
+    def flush(self) -> None:
+        """Write out everything accumulated so far"""
+        if not self._parts or self._out is None:
+            return
+        data = self.getvalue()
+        self._parts.clear()
+        if isinstance(self._out, (io.TextIOBase, codecs.StreamWriter, codecs.StreamReaderWriter)):
+            self._out.write(data)
+        else:
+            # Same error handler as XMLGenerator uses for binary outputs
+            self._out.write(data.encode(self._encoding, "xmlcharrefreplace"))
+
+
 def iri_to_uri(iri: str) -> str:
     """
     Convert an Internationalized Resource Identifier (IRI) portion to a URI
@@ -59,6 +226,18 @@ def iri_to_uri(iri: str) -> str:
     # converted.
     if iri is None:
         return iri
+    if isinstance(iri, str) and URI_SAFE.match(iri):
+        # Nothing to quote, which includes URIs that were already converted
+        return iri
+    return _quote_iri(iri)
+
+
+# Strings made only of characters that iri_to_uri() does not quote
+URI_SAFE = re.compile(r"[A-Za-z0-9_.\-~/#%\[\]=:;$&()+,!?*@']*\Z")
+
+
+@lru_cache(maxsize=4096)
+def _quote_iri(iri: str) -> str:
     return quote(iri, safe="/#%[]=:;$&()+,!?*@'~")
 
 
@@ -71,21 +250,136 @@ def http_date(epoch_seconds: float = None) -> str:
     defaults to the current time.
     Output a string in the format 'Wdy, DD Mon YYYY HH:MM:SS GMT'.
     """
+    if epoch_seconds is None:
+        return formatdate(usegmt=True)
+    return _http_date(epoch_seconds)
+
+
+@lru_cache(maxsize=1024)
+def _http_date(epoch_seconds: float) -> str:
     return formatdate(epoch_seconds, usegmt=True)
 
 
+def parse_http_date(date: str) -> Optional[int]:
+    """
+    Parse a date format as specified by HTTP RFC7231 section 7.1.1.1.
+    Return an integer expressed in seconds since the epoch, in UTC, or None
+    if the input is not a valid date.
+    """
+    try:
+        parsed = parsedate_to_datetime(date)
+    except (TypeError, ValueError, IndexError):
+        return None
+    if parsed is None:
+        return None
+    return timegm(parsed.utctimetuple())
+
+
+ETAG_MATCH = re.compile(
+    r"""
+    \A(      # start of string and capture group
+    (?:W/)?  # optional weak indicator
+    "        # opening quote
+    [^"]*    # any sequence of non-quote characters
+    "        # end quote
+    )\Z      # end of string and capture group
+""",
+    re.X,
+)
+
+
+def quote_etag(etag: str) -> str:
+    """
+    If the provided string is already a quoted ETag, return it. Otherwise,
+    wrap the string in quotes, making it a strong ETag.
+    """
+    if ETAG_MATCH.match(etag):
+        return etag
+    return '"%s"' % etag
+
+
+def parse_etags(etag_str: str) -> List[str]:
+    """
+    Parse a string of ETags given in an If-None-Match or If-Match header as
+    defined by RFC 7232. Return a list of quoted ETags, or ['*'] if all ETags
+    should be matched.
+    """
+    if etag_str.strip() == "*":
+        return ["*"]
+    matches = (ETAG_MATCH.match(etag.strip()) for etag in etag_str.split(","))
+    return [match.group(1) for match in matches if match]
+
+
+def is_not_modified(
+    headers: Mapping[str, str],
+    etag: Optional[str] = None,
+    last_modified: Optional[datetime.datetime] = None,
+) -> bool:
+    """
+    Evaluate If-None-Match and If-Modified-Since request headers against
+    the representation validators, as defined by RFC 7232 section 6.
+    If-None-Match uses the weak comparison and takes precedence.
+    """
+    if_none_match = headers.get("if-none-match")
+    if if_none_match:
+        if etag is None:
+            return False
+        etags = parse_etags(if_none_match)
+        if etags == ["*"]:
+            return True
+        target = _strip_weak(etag)
+        return any(_strip_weak(candidate) == target for candidate in etags)
+
+    if_modified_since = headers.get("if-modified-since")
+    if if_modified_since and last_modified is not None:
+        since = parse_http_date(if_modified_since)
+        return since is not None and timegm(last_modified.utctimetuple()) <= since
+    return False
+
+
+def _strip_weak(etag: str) -> str:
+    return etag[2:] if etag.startswith("W/") else etag
+
+
+def epoch_microseconds(date: datetime.datetime) -> int:
+    """
+    Return the number of microseconds since the epoch, naive datetimes
+    being taken as UTC.
+    """
+    return timegm(date.utctimetuple()) * 1000000 + date.microsecond
+
+
+# Formatted dates are memoized, as items often share timestamps. Datetimes
+# for the same instant in different time zones compare equal, so the UTC
+# offset is part of the cache key.
+
+
 def rfc2822_date(date: Union[datetime.datetime, str]) -> str:
+    return _rfc2822_date(date, _utcoffset(date))
+
+
+def rfc3339_date(date: Union[datetime.datetime, str]) -> str:
+    return _rfc3339_date(date, _utcoffset(date))
+
+
+@lru_cache(maxsize=4096)
+def _rfc2822_date(date: Union[datetime.datetime, str], offset: Optional[datetime.timedelta]) -> str:
     if not isinstance(date, datetime.datetime):
         date = datetime.datetime.combine(date, datetime.time())
     return email.utils.format_datetime(date)
 
 
-def rfc3339_date(date: Union[datetime.datetime, str]) -> str:
+@lru_cache(maxsize=4096)
+def _rfc3339_date(date: Union[datetime.datetime, str], offset: Optional[datetime.timedelta]) -> str:
     if not isinstance(date, datetime.datetime):
         date = datetime.datetime.combine(date, datetime.time())
     return date.isoformat() + ("Z" if date.utcoffset() is None else "")
 
 
+def _utcoffset(date: Union[datetime.datetime, str]) -> Optional[datetime.timedelta]:
+    return date.utcoffset() if isinstance(date, datetime.datetime) else None
+
+
 def get_tag_uri(url: str, date: datetime) -> str:
     """
     Create a TagURI.
@@ -102,18 +396,119 @@ def get_tag_uri(url: str, date: datetime) -> str:
 
 
 def add_domain(domain: str, url: str, secure: bool = False) -> str:
-    if not domain:
-        return url
-    protocol = "https" if secure else "http"
-    if url.startswith("//"):
-        # Support network-path reference - RSS requires a protocol
-        url = "%s:%s" % (protocol, url)
-    elif not url.startswith(("http://", "https://", "mailto:")):
-        url = iri_to_uri("%s://%s%s" % (protocol, domain, url))
-    return url
+    return url_normalizer(domain, secure)(url)
+
+
+class URLNormalizer:
+    """
+    Make URLs absolute for the given domain, see add_domain(). The
+    protocol and domain prefix is computed once.
+    """
+
+    __slots__ = ("domain", "protocol", "prefix")
+
+    def __init__(self, domain: Optional[str], secure: bool = False) -> None:
+        self.domain = domain
+        self.protocol = "https" if secure else "http"
+        self.prefix = "%s://%s" % (self.protocol, domain)
+
+    def __call__(self, url: str) -> str:
+        if not self.domain:
+            return url
+        if url.startswith("//"):
+            # Support network-path reference - RSS requires a protocol
+            return "%s:%s" % (self.protocol, url)
+        if url.startswith(("http://", "https://", "mailto:")):
+            return url
+        return iri_to_uri(self.prefix + url)
+
+
+@lru_cache(maxsize=64)
+def url_normalizer(domain: Optional[str], secure: bool = False) -> URLNormalizer:
+    return URLNormalizer(domain, secure)
 
 
 async def run_async_or_thread(handler: Callable, *args: Any, **kwargs: Any) -> Any:
     if iscoroutinefunction(handler):
         return await handler(*args, **kwargs)
     return await run_in_threadpool(handler, *args, **kwargs)
+
+
+def build_request(
+    path: str,
+    query: str = "",
+    secure: bool = True,
+    host: Optional[str] = None,
+    path_params: Optional[Dict[str, Any]] = None,
+) -> Request:
+    """
+    Build a GET request for the given path outside of any HTTP connection,
+    e.g. to render a feed in the background or from the command line.
+    """
+    host = host or "localhost"
+    scope = {
+        "type": "http",
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "https" if secure else "http",
+        "path": path,
+        "raw_path": path.encode("utf-8"),
+        "root_path": "",
+        "query_string": query.encode("latin-1"),
+        "headers": [(b"host", host.encode("latin-1"))],
+        "server": (host, 443 if secure else 80),
+        "client": None,
+        "path_params": path_params or {},
+    }
+    return Request(scope)
+
+
+_json_encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+
+
+def json_dumps(obj: Any) -> str:
+    """Serialize to compact JSON, with orjson if it is installed"""
+    if orjson is not None:
+        return orjson.dumps(obj).decode("utf-8")
+    return _json_encoder.encode(obj)
+
+
+def negotiate_media_type(accept: str, media_types: List[str]) -> Optional[int]:
+    """
+    Return the index of the media type (among ones in order of preference)
+    the Accept header prefers, or None if it accepts none of them.
+    """
+    ranges = []
+    for part in accept.split(","):
+        media_range, _, params = part.partition(";")
+        media_range = media_range.strip().lower()
+        if not media_range:
+            continue
+        quality = 1.0
+        for param in params.split(";"):
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        ranges.append((media_range, quality))
+    best, best_quality = None, 0.0
+    for index, media_type in enumerate(media_types):
+        main_type = media_type.split("/", 1)[0] + "/*"
+        # The most specific matching range applies
+        quality, specificity = 0.0, -1
+        for media_range, range_quality in ranges:
+            if media_range == media_type:
+                rank = 2
+            elif media_range == main_type:
+                rank = 1
+            elif media_range == "*/*":
+                rank = 0
+            else:
+                continue
+            if rank > specificity:
+                quality, specificity = range_quality, rank
+        if quality > best_quality:
+            best, best_quality = index, quality
+    return best
@@ -0,0 +1,388 @@
+"""
+WebSub (https://www.w3.org/TR/websub/) publishing: feeds advertise the hubs
+readers subscribe to (see FeedEndpoint.websub_hubs), and the hubs are
+notified when a feed changes, so that they push it to subscribers instead of
+readers polling the feed.
+
+WebSubPublisher notifies hubs; WebSubHub is a minimal hub served by the
+application itself. Both send requests with httpx, a client of which can be
+given, e.g. one with an ASGI transport to test against local stand-ins.
+"""
+import asyncio
+import hashlib
+import hmac
+import logging
+import secrets
+import time
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional, Sequence, Set
+from urllib.parse import parse_qsl, urlsplit
+
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse, Response
+from starlette.routing import Route
+
+from .lifespan import LifespanMixin
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+logger = logging.getLogger(__name__)
+
+
+def _create_client(timeout: float) -> Any:
+    if httpx is None:
+        raise RuntimeError("httpx is required for WebSub, install starlette-feedgen[websub]")
+    return httpx.AsyncClient(timeout=timeout)
+
+
+class WebSubPublisher(LifespanMixin):
+    """
+    Notify hubs of updated topics (feed URLs). Notifications are collected
+    for `delay` seconds and then sent at once, each topic once per hub
+    however many times it was notified, with at most `max_concurrency`
+    requests at a time. Failed notifications are logged.
+
+    Hubs requiring a secret to publish (see WebSubHub.publish_secret) are
+    sent theirs from `hub_secrets`, by hub URL.
+
+    The publisher follows the application lifespan, which sends pending
+    notifications and closes the client on shutdown:
+
+    >>> publisher = WebSubPublisher()
+    >>> app = Starlette(routes=routes, lifespan=publisher.lifespan)
+    """
+
+    def __init__(
+        self,
+        delay: float = 1.0,
+        client: Any = None,
+        max_concurrency: int = 10,
+        timeout: float = 10.0,
+        hub_secrets: Optional[Mapping[str, str]] = None,
+    ) -> None:
+        self.delay = delay
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.hub_secrets = dict(hub_secrets or {})
+        self._client = client
+        self._owns_client = client is None
+        # Topics to notify, by hub
+        self._pending: Dict[str, Set[str]] = {}
+        self._flush_task: Optional["asyncio.Future[None]"] = None
+
+    @property
+    def client(self) -> Any:
+        if self._client is None:
+            self._client = _create_client(self.timeout)
+        return self._client
+
+    def notify(self, topic: str, hubs: Iterable[str]) -> None:
+        """Schedule a notification of the hubs that the topic was updated"""
+        for hub in hubs:
+            self._pending.setdefault(hub, set()).add(topic)
+        if self._pending and self._flush_task is None:
+            self._flush_task = asyncio.ensure_future(self._flush_later())
+
+    async def flush(self) -> None:
+        """Send the pending notifications now"""
+        pending, self._pending = self._pending, {}
+        notifications = [(hub, topic) for hub, topics in pending.items() for topic in topics]
+        if not notifications:
+            return
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def publish(hub: str, topic: str) -> None:
+            async with semaphore:
+                await self.publish(hub, topic)
+
+        await asyncio.gather(*(publish(hub, topic) for hub, topic in notifications))
+
+    async def publish(self, hub: str, topic: str) -> bool:
+        """
+        Notify a hub that a topic was updated right away. Return whether the
+        hub accepted the notification, logging rather than raising errors.
+        """
+        headers = {}
+        if hub in self.hub_secrets:
+            headers["Authorization"] = "Bearer " + self.hub_secrets[hub]
+        try:
+            response = await self.client.post(
+                hub, data={"hub.mode": "publish", "hub.url": topic}, headers=headers
+            )
+        except Exception:
+            logger.exception("Failed to notify WebSub hub %s of %s", hub, topic)
+            return False
+        if not 200 <= response.status_code < 300:
+            logger.warning(
+                "WebSub hub %s rejected %s with status %s", hub, topic, response.status_code
+            )
+            return False
+        return True
+
+    async def close(self) -> None:
+        """Send the pending notifications and close the client if it was created here"""
+        task, self._flush_task = self._flush_task, None
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        await self.flush()
+        if self._owns_client and self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.delay)
+        self._flush_task = None
+        await self.flush()
+
+    async def shutdown(self) -> None:
+        await self.close()
+
+
+class Subscription:
+    __slots__ = ("callback", "secret", "expires")
+
+    def __init__(self, callback: str, secret: Optional[str], expires: float) -> None:
+        self.callback = callback
+        self.secret = secret
+        self.expires = expires
+
+
+class WebSubHub(LifespanMixin):
+    """
+    Minimal WebSub hub for the feeds of the application, served at `url`
+    with the route returned by route(). Subscriptions are verified with the
+    subscriber and kept in memory for `lease_seconds` (or less if asked).
+    On publish, the hub fetches the topic and delivers it to each of its
+    subscribers, signed with their secret if any, with at most
+    `max_concurrency` requests at a time.
+
+    Only topics starting with one of `topic_prefixes` can be subscribed to,
+    by default those of the origin of the hub, e.g. "https://example.com/";
+    `allow_topic` replaces this check when given.
+
+    Publish requests are only accepted over HTTP when `publish_secret` is
+    set, and must then carry it as "Authorization: Bearer <secret>".
+    Otherwise, call publish() or distribute() from the application.
+
+    >>> hub = WebSubHub("https://example.com/hub")
+    >>> app = Starlette(routes=[hub.route("/hub"), ...], lifespan=hub.lifespan)
+
+    Feeds advertise it with websub_hubs = ["https://example.com/hub"].
+    """
+
+    def __init__(
+        self,
+        url: str,
+        client: Any = None,
+        lease_seconds: int = 10 * 24 * 3600,
+        max_concurrency: int = 10,
+        timeout: float = 10.0,
+        allow_topic: Optional[Callable[[str], bool]] = None,
+        topic_prefixes: Optional[Sequence[str]] = None,
+        publish_secret: Optional[str] = None,
+    ) -> None:
+        self.url = url
+        self.lease_seconds = lease_seconds
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.allow_topic = allow_topic
+        if topic_prefixes is None:
+            origin = urlsplit(url)
+            topic_prefixes = ("%s://%s/" % (origin.scheme, origin.netloc),)
+        self.topic_prefixes = tuple(topic_prefixes)
+        self.publish_secret = publish_secret
+        self._client = client
+        self._owns_client = client is None
+        # Subscriptions by topic and callback
+        self.subscriptions: Dict[str, Dict[str, Subscription]] = {}
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._tasks: Set["asyncio.Future[Any]"] = set()
+
+    @property
+    def client(self) -> Any:
+        if self._client is None:
+            self._client = _create_client(self.timeout)
+        return self._client
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    def route(self, path: str = "/hub") -> Route:
+        return Route(path, self.endpoint, methods=["POST"])
+
+    async def endpoint(self, request: Request) -> Response:
+        # Not request.form(), which requires python-multipart
+        params = dict(parse_qsl((await request.body()).decode("utf-8", "replace")))
+        mode = params.get("hub.mode")
+        if mode in ("subscribe", "unsubscribe"):
+            return self._subscription_request(mode, params)
+        if mode == "publish":
+            if not self._is_publisher(request):
+                return PlainTextResponse("Publishing is not allowed", status_code=403)
+            topic = params.get("hub.url") or params.get("hub.topic")
+            if not topic:
+                return PlainTextResponse("hub.url is required", status_code=400)
+            if topic in self.subscriptions and self.is_allowed_topic(topic):
+                self._start(self.publish(topic))
+            return Response(status_code=204)
+        return PlainTextResponse("Unsupported hub.mode", status_code=400)
+
+    def _is_publisher(self, request: Request) -> bool:
+        if self.publish_secret is None:
+            return False
+        scheme, _, secret = request.headers.get("authorization", "").partition(" ")
+        return scheme.lower() == "bearer" and hmac.compare_digest(
+            secret.encode("utf-8"), self.publish_secret.encode("utf-8")
+        )
+
+    def is_allowed_topic(self, topic: str) -> bool:
+        """Return whether the topic can be subscribed to and published"""
+        if self.allow_topic is not None:
+            return self.allow_topic(topic)
+        return topic.startswith(self.topic_prefixes)
+
+    def _subscription_request(self, mode: str, params: Dict[str, str]) -> Response:
+        topic = params.get("hub.topic")
+        callback = params.get("hub.callback")
+        if not topic or not callback:
+            return PlainTextResponse("hub.topic and hub.callback are required", status_code=400)
+        if not callback.startswith(("http://", "https://")):
+            return PlainTextResponse("Invalid hub.callback", status_code=400)
+        if not self.is_allowed_topic(topic):
+            self._start(self._deny(topic, callback))
+            return Response(status_code=202)
+        lease_seconds = self.lease_seconds
+        try:
+            lease_seconds = max(1, min(int(params["hub.lease_seconds"]), lease_seconds))
+        except (KeyError, ValueError):
+            pass
+        self._start(self.verify(mode, topic, callback, lease_seconds, params.get("hub.secret")))
+        return Response(status_code=202)
+
+    async def verify(
+        self,
+        mode: str,
+        topic: str,
+        callback: str,
+        lease_seconds: int,
+        secret: Optional[str] = None,
+    ) -> bool:
+        """
+        Confirm the (un)subscription with the subscriber, and apply it if
+        the subscriber echoes the challenge.
+        """
+        challenge = secrets.token_urlsafe(16)
+        query = {"hub.mode": mode, "hub.topic": topic, "hub.challenge": challenge}
+        if mode == "subscribe":
+            query["hub.lease_seconds"] = str(lease_seconds)
+        try:
+            async with self.semaphore:
+                response = await self.client.get(callback, params=query)
+        except Exception:
+            logger.exception("Failed to verify WebSub subscription of %s to %s", callback, topic)
+            return False
+        if not 200 <= response.status_code < 300 or response.text != challenge:
+            return False
+        if mode == "subscribe":
+            self.subscriptions.setdefault(topic, {})[callback] = Subscription(
+                callback, secret, time.time() + lease_seconds
+            )
+        else:
+            self.subscriptions.get(topic, {}).pop(callback, None)
+        return True
+
+    async def _deny(self, topic: str, callback: str) -> None:
+        query = {"hub.mode": "denied", "hub.topic": topic, "hub.reason": "Unknown topic"}
+        try:
+            async with self.semaphore:
+                await self.client.get(callback, params=query)
+        except Exception:
+            logger.exception("Failed to deny WebSub subscription of %s to %s", callback, topic)
+
+    async def publish(self, topic: str) -> int:
+        """
+        Fetch the topic and deliver it to its subscribers. Return the number
+        of successful deliveries.
+        """
+        subscriptions = self._active_subscriptions(topic)
+        if not subscriptions:
+            return 0
+        try:
+            async with self.semaphore:
+                response = await self.client.get(topic)
+            response.raise_for_status()
+        except Exception:
+            logger.exception("Failed to fetch WebSub topic %s", topic)
+            return 0
+        content_type = response.headers.get("content-type", "application/octet-stream")
+        return await self.distribute(topic, response.content, content_type, subscriptions)
+
+    async def distribute(
+        self,
+        topic: str,
+        body: bytes,
+        content_type: str,
+        subscriptions: Optional[List[Subscription]] = None,
+    ) -> int:
+        """
+        Deliver the content of the topic to its subscribers. Return the
+        number of successful deliveries.
+        """
+        if subscriptions is None:
+            subscriptions = self._active_subscriptions(topic)
+        link = '<%s>; rel="hub", <%s>; rel="self"' % (self.url, topic)
+
+        async def deliver(subscription: Subscription) -> bool:
+            headers = {"Content-Type": content_type, "Link": link}
+            if subscription.secret:
+                digest = hmac.new(
+                    subscription.secret.encode("utf-8"), body, hashlib.sha256
+                ).hexdigest()
+                headers["X-Hub-Signature"] = "sha256=" + digest
+            try:
+                async with self.semaphore:
+                    response = await self.client.post(
+                        subscription.callback, content=body, headers=headers
+                    )
+            except Exception:
+                logger.exception("Failed to deliver %s to %s", topic, subscription.callback)
+                return False
+            if response.status_code == 410:
+                # The subscriber is gone
+                self.subscriptions.get(topic, {}).pop(subscription.callback, None)
+            return 200 <= response.status_code < 300
+
+        results = await asyncio.gather(*(deliver(s) for s in subscriptions))
+        return sum(results)
+
+    def _active_subscriptions(self, topic: str) -> List[Subscription]:
+        subscriptions = self.subscriptions.get(topic, {})
+        now = time.time()
+        for callback in [c for c, s in subscriptions.items() if s.expires <= now]:
+            del subscriptions[callback]
+        return list(subscriptions.values())
+
+    def _start(self, coro: Any) -> None:
+        task = asyncio.ensure_future(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def join(self) -> None:
+        """Wait for the verifications and deliveries in progress"""
+        while self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def close(self) -> None:
+        await self.join()
+        if self._owns_client and self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def shutdown(self) -> None:
+        await self.close()
@@ -0,0 +1,74 @@
+import re
+import time
+
+import pytest
+
+
+class FakeRedis:
+    """
+    In-memory stand-in for redis.asyncio.Redis, implementing the commands
+    RedisCacheBackend uses.
+    """
+
+    def __init__(self):
+        self.data = {}
+        self.scans = 0
+        # Last key returned by each SCAN cursor
+        self._cursors = {}
+
+    def _live(self, key):
+        value, expires_at = self.data.get(key, (None, None))
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self.data[key]
+            return None
+        return value
+
+    async def get(self, key):
+        return self._live(key)
+
+    async def set(self, key, value, px=None):
+        self.data[key] = (value, time.monotonic() + px / 1000 if px is not None else None)
+        return True
+
+    async def delete(self, *keys):
+        return sum(self.data.pop(key, None) is not None for key in keys)
+
+    async def scan(self, cursor=0, match=None, count=None):
+        self.scans += 1
+        keys = sorted(key for key in list(self.data) if self._live(key) is not None)
+        if match is not None:
+            pattern = _glob_to_regex(match)
+            keys = [key for key in keys if pattern.fullmatch(key)]
+        if cursor:
+            last = self._cursors.pop(cursor)
+            keys = [key for key in keys if key > last]
+        page = keys[: count or 10]
+        if len(page) == len(keys):
+            return 0, page
+        next_cursor = len(self._cursors) + self.scans
+        self._cursors[next_cursor] = page[-1]
+        return next_cursor, page
+
+    def pttl(self, key):
+        expires_at = self.data[key][1]
+        return -1 if expires_at is None else int((expires_at - time.monotonic()) * 1000)
+
+
+def _glob_to_regex(pattern):
+    parts = []
+    chars = iter(pattern)
+    for char in chars:
+        if char == "\\":
+            parts.append(re.escape(next(chars, "\\")))
+        elif char == "*":
+            parts.append(".*")
+        elif char == "?":
+            parts.append(".")
+        else:
+            parts.append(re.escape(char))
+    return re.compile("".join(parts), re.S)
+
+
+@pytest.fixture
+def redis():
+    return FakeRedis()
@@ -0,0 +1,80 @@
+import asyncio
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+from starlette_feedgen import AggregateFeedEndpoint
+
+START = datetime(2020, 1, 1, tzinfo=timezone.utc)
+
+
+def _post(section, index, post_id=None):
+    post = {"section": section, "published": START + timedelta(hours=index)}
+    if post_id is not None:
+        post["id"] = post_id
+    return post
+
+
+def _merge(feed):
+    async def run():
+        return [item async for item in feed.merge_sources()]
+
+    return asyncio.run(run())
+
+
+def _endpoint(cls):
+    return cls({"type": "http", "method": "GET", "path": "/"}, None, None)
+
+
+def test_items_without_guid_or_link_are_all_kept():
+    class River(AggregateFeedEndpoint):
+        def get_sources(self):
+            return ["a", "b"]
+
+        def get_source_items(self, section):
+            return [_post(section, index) for index in range(5, 0, -1)]
+
+        def item_pubdate(self, item):
+            return item["published"]
+
+    items = _merge(_endpoint(River))
+    assert len(items) == 10
+    assert [item["published"] for item in items] == sorted(
+        (item["published"] for item in items), reverse=True
+    )
+
+
+def test_duplicates_are_skipped_and_async_hooks_awaited_once():
+    calls = []
+
+    class River(AggregateFeedEndpoint):
+        def get_sources(self):
+            return ["a", "b"]
+
+        def get_source_items(self, section):
+            # Post 1 is in both sections
+            return [_post(section, 2, section), _post(section, 1, 1)]
+
+        async def item_pubdate(self, item):
+            calls.append(("item_pubdate", item["id"]))
+            return item["published"]
+
+        async def item_guid(self, item):
+            calls.append(("item_guid", item["id"]))
+            return item["id"]
+
+    async def run():
+        feed = _endpoint(River)
+        items = [item async for item in feed.merge_sources()]
+        kwargs = await feed._get_batch_kwargs(items, True)
+        return items, kwargs
+
+    items, kwargs = asyncio.run(run())
+    assert [item["id"] for item in items] == ["a", "b", 1]
+    assert [item_kwargs["unique_id"] for item_kwargs in kwargs] == ["a", "b", 1]
+    # Once per item and hook, post 1 being two items
+    expected = {"a": 1, "b": 1, 1: 2}
+    assert Counter(calls) == {
+        (hook, post_id): count
+        for hook in ("item_pubdate", "item_guid")
+        for post_id, count in expected.items()
+    }
@@ -0,0 +1,53 @@
+import asyncio
+
+from starlette_feedgen.cache import CachedFeed, FeedCache, RedisCacheBackend
+
+
+def _feed(body=b"<rss/>"):
+    return CachedFeed(body, "application/rss+xml", {"ETag": '"1"'}, encodings={"gzip": b"gz"})
+
+
+def test_redis_backend_round_trip(redis):
+    async def run():
+        cache = FeedCache(ttl=60, stale_ttl=30, backend=RedisCacheBackend(redis))
+        assert await cache.get("feed") is None
+        await cache.set("feed", _feed())
+        cached = await cache.get("feed")
+        assert cached.body == b"<rss/>"
+        assert cached.encodings == {"gzip": b"gz"}
+        assert cached.headers == {"ETag": '"1"'}
+        assert not cached.is_stale
+        # The value outlives ttl by stale_ttl, so that it can be served stale
+        assert 89000 < redis.pttl("feedgen:feed") <= 90000
+        await cache.invalidate("feed")
+        assert await cache.get("feed") is None
+        assert cache.stats.hits == 1 and cache.stats.misses == 2
+
+    asyncio.run(run())
+
+
+def test_redis_backend_immutable_feed_never_expires(redis):
+    async def run():
+        cache = FeedCache(ttl=60, backend=RedisCacheBackend(redis))
+        feed = _feed()
+        feed.immutable = True
+        await cache.set("archive", feed)
+        assert redis.pttl("feedgen:archive") == -1
+
+    asyncio.run(run())
+
+
+def test_redis_backend_clear_only_deletes_its_prefix(redis):
+    async def run():
+        backend = RedisCacheBackend(redis, prefix="feeds[1]*:")
+        backend.scan_count = 3
+        for index in range(10):
+            await backend.set("feed%d" % index, b"x")
+        await redis.set("feeds[1]-other", b"kept")
+        await redis.set("other:feed", b"kept")
+        await FeedCache(backend=backend).clear()
+        assert sorted(redis.data) == ["feeds[1]-other", "other:feed"]
+        # Deleted in SCAN pages rather than with a blocking KEYS
+        assert redis.scans > 1
+
+    asyncio.run(run())
@@ -0,0 +1,59 @@
+import datetime
+import gc
+import tracemalloc
+
+from starlette_feedgen.generator import DefaultFeed, Enclosure, FeedItem
+
+ITEM_COUNT = 10000
+
+
+def _item_kwargs(index):
+    return dict(
+        title="Item %d" % index,
+        link="https://example.com/items/%d" % index,
+        description="Description of item %d" % index,
+        pubdate=datetime.datetime(2020, 1, 1) + datetime.timedelta(minutes=index),
+        unique_id="item-%d" % index,
+        enclosures=[Enclosure("https://example.com/items/%d.mp3" % index, "1024", "audio/mpeg")],
+    )
+
+
+def _traced_bytes_per_item(build):
+    # Values are built beforehand so that only the item containers are traced
+    values = [_item_kwargs(index) for index in range(ITEM_COUNT)]
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        items = [build(kwargs) for kwargs in values]
+        size = tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+    assert len(items) == ITEM_COUNT
+    return size / ITEM_COUNT
+
+
+def _dict_item(kwargs):
+    # The dict items were built with every field, as make_item() did
+    item = dict.fromkeys(FeedItem.fields)
+    item.update(kwargs)
+    return item
+
+
+def test_feed_item_uses_less_memory_than_dict():
+    feed = DefaultFeed("Feed", "https://example.com/", "Description")
+    slotted = _traced_bytes_per_item(lambda kwargs: feed.make_item(**kwargs))
+    dicts = _traced_bytes_per_item(_dict_item)
+    assert slotted < dicts * 0.75, (slotted, dicts)
+
+
+def test_feed_item_reads_like_dict():
+    feed = DefaultFeed("Feed", "https://example.com/", "Description")
+    item = feed.make_item(foo="bar", **_item_kwargs(1))
+    assert item["title"] == "Item 1"
+    assert item.get("foo") == "bar"
+    assert item.get("missing") is None
+    assert "foo" in item
+    item["title"] = "Renamed"
+    assert item.title == "Renamed"
+    assert dict(item.items())["unique_id"] == "item-1"
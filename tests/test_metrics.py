@@ -0,0 +1,86 @@
+import asyncio
+
+import httpx
+from starlette.applications import Starlette
+from starlette.routing import Route
+
+from starlette_feedgen import FeedCache, FeedEndpoint
+from starlette_feedgen.metrics import InMemorySink
+
+
+class Item:
+    def __init__(self, index):
+        self.title = "Item %d" % index
+        self.link = "/items/%d" % index
+        self.description = "Description"
+
+
+def _get(feed_class, count=1):
+    async def run():
+        app = Starlette(routes=[Route("/feed", feed_class)])
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as client:
+            return [await client.get("/feed") for _ in range(count)]
+
+    return asyncio.run(run())
+
+
+def _stage_names(timings):
+    return [stage.name for stage in timings.stages]
+
+
+def test_cache_miss_and_hit_are_timed():
+    sink = InMemorySink()
+
+    class Feed(FeedEndpoint):
+        title = "Feed"
+        description = "Description"
+        metrics = sink
+        server_timing = True
+        cache = FeedCache()
+
+        def get_items(self):
+            return [Item(index) for index in range(3)]
+
+    miss, hit = _get(Feed, 2)
+    assert (Feed.cache.stats.misses, Feed.cache.stats.hits) == (1, 1)
+    assert [timings.status for timings in sink.records] == [200, 200]
+
+    rendered, cached = sink.records
+    # Items are fetched and serialized within the cache lookup of a miss only
+    assert _stage_names(rendered) == ["get_object", "validators", "items", "serialize", "cache"]
+    assert _stage_names(cached) == ["get_object", "validators", "cache"]
+    assert rendered.item_count == 3
+    assert rendered.bytes == len(miss.content)
+    assert cached.bytes == len(hit.content) == len(miss.content)
+    for timings in sink.records:
+        assert timings.endpoint == Feed.__qualname__
+        assert timings.path == "/feed"
+        assert timings.seconds >= max(stage.offset + stage.seconds for stage in timings.stages)
+
+    for response, timings in ((miss, rendered), (hit, cached)):
+        header = response.headers["Server-Timing"]
+        metrics = [metric.split(";dur=") for metric in header.split(", ")]
+        assert [name for name, _ in metrics] == _stage_names(timings)
+        assert all(float(duration) >= 0 for _, duration in metrics)
+
+
+def test_streamed_feed_is_timed_once_sent():
+    sink = InMemorySink()
+
+    class Feed(FeedEndpoint):
+        title = "Feed"
+        description = "Description"
+        metrics = sink
+        stream = True
+
+        async def get_items(self):
+            for index in range(3):
+                yield Item(index)
+
+    (response,) = _get(Feed)
+    (timings,) = sink.records
+    assert "Server-Timing" not in response.headers
+    assert _stage_names(timings)[-1] == "stream"
+    assert timings.item_count == 3
+    assert timings.bytes == len(response.content)
@@ -0,0 +1,70 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from starlette_feedgen import FeedEndpoint
+
+START = datetime(2020, 1, 1, tzinfo=timezone.utc)
+# Out of order, with a tie
+HOURS = [3, 7, 1, 9, 7, 2, 8]
+
+
+def _endpoint(cls):
+    return cls({"type": "http", "method": "GET", "path": "/"}, None, None)
+
+
+def _render(feed):
+    async def run():
+        return [kwargs async for batch in feed._iter_batch_kwargs(True) for kwargs in batch]
+
+    return asyncio.run(run())
+
+
+def test_unordered_items_are_selected_before_being_rendered():
+    calls = {"limit": [], "item_pubdate": [], "item_title": []}
+
+    class Feed(FeedEndpoint):
+        title = "Feed"
+        description = "Description"
+        max_items = 3
+        order_by = "pubdate"
+        item_batch_size = 2
+
+        async def get_items(self, limit):
+            calls["limit"].append(limit)
+            for index, hours in enumerate(HOURS):
+                yield index, START + timedelta(hours=hours)
+
+        async def item_pubdate(self, item):
+            calls["item_pubdate"].append(item[0])
+            return item[1]
+
+        def item_title(self, item):
+            calls["item_title"].append(item[0])
+            return str(item[0])
+
+    kwargs = _render(_endpoint(Feed))
+    assert [item_kwargs["title"] for item_kwargs in kwargs] == ["3", "6", "1"]
+    # The whole of get_items is needed to sort the items
+    assert calls["limit"] == [None]
+    assert sorted(calls["item_pubdate"]) == list(range(len(HOURS)))
+    assert sorted(calls["item_title"]) == [1, 3, 6]
+
+
+def test_limit_is_pushed_down_with_ordered_items():
+    limits = []
+
+    class Feed(FeedEndpoint):
+        title = "Feed"
+        description = "Description"
+        max_items = 3
+        order_by = "pubdate"
+
+        def get_items(self, limit, order_by):
+            limits.append((limit, order_by))
+            return [(i, START - timedelta(hours=i)) for i in range(limit)]
+
+        def item_pubdate(self, item):
+            return item[1]
+
+    assert len(_render(_endpoint(Feed))) == 3
+    assert limits == [(3, "pubdate")]
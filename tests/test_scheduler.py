@@ -0,0 +1,31 @@
+import asyncio
+
+from starlette_feedgen import FeedCache, FeedEndpoint
+from starlette_feedgen.scheduler import FeedRefreshScheduler
+
+
+def test_feeds_registered_after_start_are_refreshed():
+    renders = []
+
+    class Feed(FeedEndpoint):
+        title = "Feed"
+        description = "Description"
+        cache = FeedCache()
+
+        def get_items(self):
+            renders.append(self.scope["path"])
+            return []
+
+    async def run():
+        scheduler = FeedRefreshScheduler(interval=60)
+        await scheduler.start()
+        assert scheduler.running
+        scheduler.register(Feed, "/feed")
+        await asyncio.sleep(0.05)
+        await scheduler.stop()
+        assert not scheduler.running
+        scheduler.register(Feed, "/other")
+        await asyncio.sleep(0.05)
+
+    asyncio.run(run())
+    assert renders == ["/feed"]
@@ -0,0 +1,60 @@
+import asyncio
+
+from starlette_feedgen import FeedEndpoint
+
+
+class Item:
+    def __init__(self, index):
+        self.title = "Item %d" % index
+        self.link = "/items/%d" % index
+        self.description = "Description"
+
+
+def _scope(path="/feed"):
+    return {
+        "type": "http",
+        "method": "GET",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": b"",
+        "scheme": "http",
+        "server": ("testserver", 80),
+        "headers": [],
+        "http_version": "1.1",
+        "path_params": {},
+    }
+
+
+def test_streamed_item_is_sent_before_the_batch_is_full():
+    sent = asyncio.Event()
+
+    class Feed(FeedEndpoint):
+        title = "Feed"
+        description = "Description"
+        stream = True
+
+        async def get_items(self):
+            yield Item(0)
+            # Only continues once the first item reached the client
+            await sent.wait()
+            yield Item(1)
+
+    chunks = []
+
+    async def receive():
+        await asyncio.sleep(3600)
+
+    async def send(message):
+        body = message.get("body", b"")
+        chunks.append(body)
+        if b"Item 0" in body:
+            sent.set()
+
+    async def run():
+        await asyncio.wait_for(Feed(_scope(), receive, send), timeout=5)
+
+    asyncio.run(run())
+    body = b"".join(chunks)
+    assert body.count(b"<item>") == 2
+    assert body.endswith(b"</rss>")
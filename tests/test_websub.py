@@ -0,0 +1,119 @@
+import asyncio
+
+import httpx
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse, Response
+from starlette.routing import Route
+
+from starlette_feedgen import combine_lifespans
+from starlette_feedgen.websub import WebSubHub, WebSubPublisher
+
+HUB = "https://example.com/hub"
+TOPIC = "https://example.com/feed"
+FEED = b"<rss>feed</rss>"
+
+
+def _hub(deliveries, verified=True, **kwargs):
+    """Return a hub served by an app that also serves the topic and subscribers"""
+
+    async def feed(request: Request) -> Response:
+        return Response(FEED, media_type="application/rss+xml")
+
+    async def callback(request: Request) -> Response:
+        if request.method == "GET":
+            challenge = request.query_params["hub.challenge"] if verified else "wrong"
+            return PlainTextResponse(challenge)
+        deliveries.append((request.url.path, request.headers, await request.body()))
+        return Response(status_code=204)
+
+    app = Starlette(
+        routes=[Route("/feed", feed), Route("/callback/{name}", callback, methods=["GET", "POST"])]
+    )
+    transport = httpx.ASGITransport(app=app)
+    hub = WebSubHub(HUB, client=httpx.AsyncClient(transport=transport), **kwargs)
+    app.router.routes.append(hub.route("/hub"))
+    return hub
+
+
+def _subscribe(callback, **params):
+    return {"hub.mode": "subscribe", "hub.topic": TOPIC, "hub.callback": callback, **params}
+
+
+def test_publish_is_fanned_out_to_verified_subscribers():
+    deliveries = []
+
+    async def run():
+        hub = _hub(deliveries, publish_secret="s3cret")
+        client = hub.client
+        for name in ("a", "b"):
+            callback = f"https://example.com/callback/{name}"
+            response = await client.post(HUB, data=_subscribe(callback))
+            assert response.status_code == 202
+        await hub.join()
+        assert sorted(hub.subscriptions[TOPIC]) == [
+            "https://example.com/callback/a",
+            "https://example.com/callback/b",
+        ]
+
+        publisher = WebSubPublisher(client=client, hub_secrets={HUB: "s3cret"})
+        assert await publisher.publish(HUB, TOPIC)
+        await hub.join()
+
+        # Publishing requires the secret
+        assert not await WebSubPublisher(client=client).publish(HUB, TOPIC)
+        await hub.join()
+
+    asyncio.run(run())
+    assert sorted(path for path, _, _ in deliveries) == ["/callback/a", "/callback/b"]
+    for _, headers, body in deliveries:
+        assert body == FEED
+        assert headers["content-type"] == "application/rss+xml"
+        assert headers["link"] == f'<{HUB}>; rel="hub", <{TOPIC}>; rel="self"'
+
+
+def test_subscription_requires_the_challenge_to_be_echoed():
+    deliveries = []
+
+    async def run():
+        hub = _hub(deliveries, verified=False)
+        client = hub.client
+        response = await client.post(HUB, data=_subscribe("https://example.com/callback/a"))
+        assert response.status_code == 202
+        await hub.join()
+        assert not hub.subscriptions.get(TOPIC)
+
+        # Topics outside of the hub's origin are denied
+        data = _subscribe("https://example.com/callback/a", **{"hub.topic": "https://evil.com/"})
+        await client.post(HUB, data=data)
+        await hub.join()
+        assert not hub.subscriptions.get("https://evil.com/")
+
+    asyncio.run(run())
+    assert deliveries == []
+
+
+def test_combined_lifespans_start_in_order_and_stop_in_reverse():
+    events = []
+
+    class Service:
+        def __init__(self, name):
+            self.name = name
+
+        def lifespan(self, app):
+            return self
+
+        async def __aenter__(self):
+            events.append("start " + self.name)
+            return {self.name: True}
+
+        async def __aexit__(self, *exc_info):
+            events.append("stop " + self.name)
+
+    async def run():
+        lifespan = combine_lifespans(Service("a").lifespan, Service("b").lifespan)
+        async with lifespan(None) as state:
+            assert state == {"a": True, "b": True}
+
+    asyncio.run(run())
+    assert events == ["start a", "start b", "stop b", "stop a"]